@@ -1,22 +1,70 @@
 import tkinter as tk
 from tkinter import messagebox
-from PIL import Image, ImageTk
-import cv2
-from gesture_detector import GestureDetectorLogger
-import pickle
-import os
+from artwork_store import ArtworkStore
+from evaluation_store import EvaluationStore
+from gesture_events import ONSET, GestureEventMachine
+from gesture_pipeline import GesturePipeline
+from image_cache import ImageCache
+import contextlib
+import multiprocessing
+import queue
+import threading
 import time
+import uuid
+
+class StartupTimer:
+    # Records how long the phases of the application startup take.
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        # Measures the duration of a phase.
+        phase_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(f"{name} {time.perf_counter() - phase_start:.2f} s")
+
+    def mark(self, name):
+        # Records the moment a milestone was reached, relative to the start of the application.
+        self._record(f"{name} at {time.perf_counter() - self.start:.2f} s")
+
+    def _record(self, entry):
+        with self._lock:
+            self.phases.append(entry)
+
+    def report(self):
+        with self._lock:
+            return "Startup: " + ", ".join(self.phases)
 
 class ArtApp:
-    def __init__(self, root):
+    def __init__(self, root, lazy_startup=True, gesture_source=None, metrics=None, backend_options=None,
+                 motion_threshold=0.01, visitor_idle_timeout=60.0):
+        self.startup_timer = StartupTimer()
         self.root = root
         self.root.title("Art Evaluation App")  # Sets the title of the main window.
 
         self.root.geometry("800x600")  # Sets the dimensions of the main window.
         self.root.resizable(True, True)  # Allows window resizing.
 
-        self.detector = GestureDetectorLogger(video_mode=True)  # Initializes the gesture detector.
-        self.cap = cv2.VideoCapture(0)  # Open the webcam.
+        # The gesture detector, the webcam and the pipeline running them are created by warm_up(),
+        # in the background when lazy_startup is set, so that the first painting is shown immediately.
+        # Alternatively, the gestures can come from a gesture_source with the same start(), poll() and stop()
+        # methods as the pipeline, such as a StationClient receiving them from a station_pool.py process.
+        self.detector = None
+        self.cap = None
+        self.pipeline = None
+        self.warm_up_results = queue.Queue()  # Receives the outcome of warm_up() on the main thread.
+        self.metrics = metrics  # The measurements of the gesture detector, created by it if not given.
+        # The recognition backend of gesture_backends.py and its options, the hand landmarks and the trained model
+        # by default.
+        self.backend_options = dict(backend_options or {})
+        # The fraction of the image that has to change for the hands to be looked for while no hand is tracked,
+        # or 0 to look for them in every frame.
+        self.motion_threshold = motion_threshold
 
         # List of images used in the application.
         self.images = ["images/image1.jpg", "images/image2.jpg", "images/image3.jpg", "images/image4.jpg",
@@ -44,8 +92,12 @@ class ArtApp:
         }
 
         self.current_image_index = 0  # The index of the current image.
+        # Cache of the decoded and resized images, which are resized from the renditions built by artwork_store.py.
+        self.image_cache = ImageCache(store=ArtworkStore())
         self.pop_up_open = False  # Status of the pop-up window.
+        self.closed = False  # Whether the application has been closed.
 
+        self.evaluation_store = EvaluationStore()  # Log of the ratings, which imports evaluations.pkl once.
         self.evaluations = self.load_evaluations()  # Load ratings from file.
 
         # Creates a label to display the image.
@@ -56,42 +108,69 @@ class ArtApp:
         self.result_label = tk.Label(self.root, text="", font=("Helvetica", 16))
         self.result_label.pack(pady=10)
 
-        self.last_gesture_time = 0  # The time of the last gesture detected.
-        self.min_gesture_interval = 2  # Minimum interval between gestures in seconds.
+        # Creates a label for displaying the status of the gesture recognition.
+        self.status_label = tk.Label(self.root, text="Warming up the gesture recognition...", font=("Helvetica", 10))
+        self.status_label.pack()
+
+        # Turns the recognized gestures into events, so that each gesture triggers its action once.
+        self.gesture_events = GestureEventMachine()
+        self.gesture_poll_interval = 15  # Interval in milliseconds for collecting the recognized gestures.
+        # A gesture made after visitor_idle_timeout seconds without any gesture is taken to come from a new visitor,
+        # whose ratings are logged in a new session of the evaluation store.
+        self.visitor_idle_timeout = visitor_idle_timeout
+        self.last_gesture_time = None  # The time of the last gesture, from time.monotonic().
+        self.resize_delay = 150  # Time in milliseconds without resizing before the image is redrawn in high quality.
+        self.resize_job = None  # The pending high-quality redraw after a resize.
+        self.displayed_window_size = None  # The window size the displayed image was resized for.
 
         self.update_image()  # Refresh the displayed image.
+        self.root.after_idle(self.startup_timer.mark, "first painting shown")
+
+        self.warm_up_thread = None
+        if gesture_source is not None:
+            try:
+                gesture_source.start()
+                self.pipeline = gesture_source
+                self.status_label.config(text="")
+            except (OSError, multiprocessing.AuthenticationError) as e:
+                # The pool may be unreachable, or have another authentication key.
+                print(f"Error: Could not connect to the gesture source: {e}")
+                self.status_label.config(text="Gesture recognition is unavailable.")
+        elif lazy_startup:
+            # Loads the gesture detector and opens the webcam in the background.
+            self.warm_up_thread = threading.Thread(target=self.warm_up, name="gesture-warm-up", daemon=True)
+            self.warm_up_thread.start()
+        else:
+            self.warm_up()
         self.update_gesture()  # Update gestures.
 
         # Sets the action for closing the window.
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         self.root.bind("<Configure>", self.on_resize)  # Sets the action for resizing.
+        self.root.bind("<F12>", self.toggle_metrics)  # Sets the action for measuring the gesture recognition.
 
     def load_evaluations(self):
-        # Load the ratings from the file if they exist, otherwise create an empty dictionary.
-        if os.path.exists('evaluations.pkl'):
-            with open('evaluations.pkl', 'rb') as f:
-                loaded_evaluations = pickle.load(f)
-                # Update keys with 'images/' prefix
-                return {f'images/{k}': v for k, v in loaded_evaluations.items()}
-        else:
-            return {image: None for image in self.images}
+        # Load the latest rating of every image from the log; images that were never rated have no rating.
+        evaluations = {image: None for image in self.images}
+        evaluations.update(self.evaluation_store.latest_ratings())
+        return evaluations
 
-    def save_evaluations(self):
-        # Save ratings to file.
-        # Remove the 'images/' prefix from the save.
-        evaluations_to_save = {k.split('/', 1)[1]: v for k, v in self.evaluations.items()}
-        with open('evaluations.pkl', 'wb') as f:
-            pickle.dump(evaluations_to_save, f)
+    def save_evaluation(self, image_path, rating):
+        # Record the rating of an image. The log is written in the background, so this does not block the UI.
+        self.evaluations[image_path] = rating
+        self.evaluation_store.record(image_path, rating)
 
     def update_image(self):
         # Updates the displayed image based on the current index.
         image_path = self.images[self.current_image_index]
-        image = Image.open(image_path)
-        self.display_image(image)
+        self.display_image(image_path)
         # Updates the label text with the rating of the current image.
         self.result_label.config(text=self.evaluations[self.images[self.current_image_index]] if self.evaluations[self.images[self.current_image_index]] else "")
+        # Prepares the next and previous images in the background, so that navigating to them is instant.
+        neighbors = [self.images[(self.current_image_index + offset) % len(self.images)] for offset in (1, -1)]
+        self.image_cache.prefetch(neighbors, *self.window_size())
 
-    def display_image(self, image):
+    def window_size(self):
         # Gets the dimensions of the window.
         window_width = self.root.winfo_width()
         window_height = self.root.winfo_height() - 50  # Adjust the height to accommodate the label.
@@ -99,46 +178,104 @@ class ArtApp:
         if window_width <= 1 or window_height <= 1:
             window_width = 800
             window_height = 600
+        return window_width, window_height
 
-        # Calculates the aspect ratio of the image and the window.
-        image_ratio = image.width / image.height
-        window_ratio = window_width / window_height
-
-        # Resize the image to fit in the window.
-        if image_ratio > window_ratio:
-            new_width = window_width
-            new_height = int(window_width / image_ratio)
-        else:
-            new_height = window_height
-            new_width = int(window_height * image_ratio)
+    def display_image(self, image_path, preview=False):
+        # Calculates the size of the image resized to fit in the window, keeping its aspect ratio.
+        window_size = self.window_size()
+        new_width, new_height = self.image_cache.display_size(image_path, *window_size)
 
-        # If the new dimensions are valid, resize the image and update the label.
+        # If the new dimensions are valid, get the resized image from the cache and update the label.
         if new_width > 0 and new_height > 0:
-            resized_image = image.resize((new_width, new_height), Image.LANCZOS)
-            self.current_image = ImageTk.PhotoImage(resized_image)
+            if preview:
+                # A fast low-quality resize, shown while the window is being resized.
+                self.current_image = self.image_cache.preview(image_path, (new_width, new_height))
+            else:
+                self.current_image = self.image_cache.photo(image_path, (new_width, new_height))
             self.image_label.config(image=self.current_image)
             self.image_label.image = self.current_image
+            self.displayed_window_size = window_size
         else:
             print("Warning: Calculated image dimensions are zero. Skipping resize.")  # Display a warning if the calculated dimensions are zero.
 
+    def warm_up(self):
+        # Imports and initializes the gesture detector and opens the webcam.
+        # This may run on a background thread, so the result is passed back through a queue.
+        try:
+            with self.startup_timer.phase("import detector"):
+                import cv2
+                from frame_governor import FrameRateGovernor
+                from gesture_backends import DEFAULT_BACKEND, create_backend
+                from motion_gate import MotionGate
+            with self.startup_timer.phase("load detector and model"):
+                # Initializes the gesture detector. The hands backend only processes the region around a tracked
+                # hand, and skips the frames in which nothing moves while there is no hand.
+                options = dict(self.backend_options)
+                if options.get('backend', DEFAULT_BACKEND) == 'hands':
+                    options.setdefault('tracking_mode', True)
+                    if self.motion_threshold > 0:
+                        options.setdefault('motion_gate', MotionGate(min_changed_fraction=self.motion_threshold))
+                detector = create_backend(metrics=self.metrics, **options)
+            with self.startup_timer.phase("open webcam"):
+                cap = cv2.VideoCapture(0)  # Open the webcam.
+                # Sets the capture resolution and lowers the frame rate while nobody is in front of the camera.
+                governor = FrameRateGovernor()
+                governor.configure(cap)
+        except Exception as e:
+            self.warm_up_results.put(e)
+        else:
+            self.warm_up_results.put((detector, cap, governor))
+
+    def finish_warm_up(self):
+        # Starts the gesture pipeline once warm_up() is done. Returns whether gestures can be handled.
+        if self.pipeline is not None:
+            return True
+        try:
+            result = self.warm_up_results.get_nowait()
+        except queue.Empty:
+            return False
+
+        if isinstance(result, Exception):
+            print(f"Error: Could not start the gesture recognition: {result}")
+            self.status_label.config(text="Gesture recognition is unavailable.")
+            return False
+
+        self.detector, self.cap, governor = result
+        # Runs the webcam capture and the gesture inference on background threads.
+        self.pipeline = GesturePipeline(self.detector, self.cap, governor=governor)
+        self.pipeline.start()
+        self.status_label.config(text="")
+        self.startup_timer.mark("gestures ready")
+        print(self.startup_timer.report())
+        return True
+
     def update_gesture(self):
-        # Read a frame from the webcam.
-        ret, frame = self.cap.read()
-        if ret:
-            # Detect and record the gesture.
-            gesture = self.detector.detect_and_log(frame, 0)
-            self.handle_gesture(gesture)
+        if self.closed:
+            return
+        if not self.finish_warm_up():
+            # The gesture recognition is still warming up.
+            self.root.after(self.gesture_poll_interval, self.update_gesture)
+            return
 
-        self.root.after(100, self.update_gesture)  # Recall this method after 100ms.
+        # Handle the gestures recognized by the background pipeline since the last check.
+        for gesture in self.pipeline.poll():
+            for event in self.gesture_events.update(gesture):
+                if event.kind == ONSET:
+                    self.track_visitor(event.timestamp)
+                    self.handle_gesture(event.gesture)
+                if self.closed:
+                    return  # A gesture closed the application.
 
-    def handle_gesture(self, gesture):
-        # Handle the detected gesture.
-        current_time = time.time()
-        if current_time - self.last_gesture_time < self.min_gesture_interval:
-            return
+        self.root.after(self.gesture_poll_interval, self.update_gesture)  # Recall this method shortly.
 
-        self.last_gesture_time = current_time
+    def track_visitor(self, timestamp):
+        # Starts a new session with a new visitor id for the first gesture and after a long time without gestures.
+        if self.last_gesture_time is None or timestamp - self.last_gesture_time > self.visitor_idle_timeout:
+            self.evaluation_store.start_session(uuid.uuid4().hex)
+        self.last_gesture_time = timestamp
 
+    def handle_gesture(self, gesture):
+        # Handle the detected gesture.
         # Manage different gestures.
         if gesture in ["Next", "Previous"]:
             if self.pop_up_open:
@@ -151,13 +288,11 @@ class ArtApp:
 
             self.update_image()
         elif gesture == "Like":
-            self.evaluations[self.images[self.current_image_index]] = "I like it."
+            self.save_evaluation(self.images[self.current_image_index], "I like it.")
             self.result_label.config(text="I like it.")
-            self.save_evaluations()
         elif gesture == "Dislike":
-            self.evaluations[self.images[self.current_image_index]] = "I don't like it."
+            self.save_evaluation(self.images[self.current_image_index], "I don't like it.")
             self.result_label.config(text="I don't like it.")
-            self.save_evaluations()
         elif gesture == "Closed Palm":
             self.on_closing()
         elif gesture == "Open Palm" and not self.pop_up_open:
@@ -187,17 +322,99 @@ class ArtApp:
             self.pop_up_open = False
             self.description_popup.destroy()
 
+    def toggle_metrics(self, event=None):
+        # Starts or stops measuring the stages of the gesture recognition, and prints the measurements when stopping.
+        if self.detector is None:
+            return
+        metrics = self.detector.metrics
+        metrics.enabled = not metrics.enabled
+        if metrics.enabled:
+            print("Gesture recognition metrics enabled.")
+        else:
+            print(f"Gesture recognition metrics disabled: {metrics.summary()}")
+
     def on_closing(self):
         # Save ratings and release resources before closing the app.
-        self.save_evaluations()
-        self.cap.release()
+        self.closed = True
+        self.evaluation_store.close()  # Writes the ratings that are still waiting to be saved.
+        # Stop the background threads before releasing the webcam.
+        if self.pipeline is not None and not self.pipeline.stop():
+            # A thread is still blocked reading the webcam or detecting the hands. Releasing them under it could
+            # crash the process, so they are left to the daemon threads, which end with the process.
+            print("Warning: The gesture recognition did not stop in time; the webcam is not released.")
+        else:
+            self.release_gesture_recognition()
+        self.image_cache.close()
         self.root.destroy()
 
+    def release_gesture_recognition(self):
+        # Closes the gesture detector and releases the webcam once nothing uses them anymore.
+        if self.detector is not None:
+            self.detector.close()
+        if self.cap is None and self.warm_up_thread is not None:
+            # The webcam may still be opening in the background, so we wait briefly for it to release it.
+            self.warm_up_thread.join(timeout=1.0)
+            try:
+                result = self.warm_up_results.get_nowait()
+                if not isinstance(result, Exception):
+                    self.cap = result[1]
+            except queue.Empty:
+                pass
+        if self.cap is not None:
+            self.cap.release()
+
     def on_resize(self, event):
-        # Refreshes the image when the window is resized.
+        # Only the resizing of the main window matters, not the configuration of the widgets inside it.
+        if event.widget is not self.root or self.window_size() == self.displayed_window_size:
+            return
+
+        # Shows a quick preview right away and redraws the image in high quality once the resizing stops.
+        self.display_image(self.images[self.current_image_index], preview=True)
+        if self.resize_job is not None:
+            self.root.after_cancel(self.resize_job)
+        self.resize_job = self.root.after(self.resize_delay, self.finish_resize)
+
+    def finish_resize(self):
+        # Refreshes the image in high quality after the window was resized.
+        self.resize_job = None
         self.update_image()
 
 if __name__ == "__main__":
+    import argparse
+    from gesture_backends import add_backend_arguments, backend_options
+    parser = argparse.ArgumentParser(description="Gesture-controlled art gallery.")
+    parser.add_argument("--station", type=int, help="Use the gestures of this station of a station pool instead of the webcam. "
+                                                    "The key of the pool is read from GESTURE_POOL_AUTHKEY.")
+    parser.add_argument("--pool-address", default="localhost:6000", help="Address of the station pool, as host:port.")
+    parser.add_argument("--metrics-file", help="File to which the gesture recognition metrics are written regularly.")
+    parser.add_argument("--metrics-address", help="Address on which the metrics are served, as host:port or port.")
+    parser.add_argument("--motion-threshold", type=float, default=0.01,
+                        help="Fraction of the image that has to change to look for hands, or 0 to always look for them.")
+    parser.add_argument("--visitor-timeout", type=float, default=60.0,
+                        help="Seconds without any gesture after which the next gesture starts a new visitor session.")
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+
+    metrics = exporter = None
+    if args.metrics_file or args.metrics_address:
+        from gesture_metrics import MetricsExporter, PipelineMetrics, parse_metrics_address
+        metrics = PipelineMetrics()
+        exporter = MetricsExporter(metrics, args.metrics_file,
+                                   parse_metrics_address(args.metrics_address) if args.metrics_address else None)
+        exporter.start()
+
+    gesture_source = None
+    if args.station is not None:
+        from station_pool import StationClient, parse_address
+        try:
+            gesture_source = StationClient(args.station, parse_address(args.pool_address))
+        except ValueError as e:
+            parser.error(str(e))
+
     root = tk.Tk()  # Creates the main window.
-    app = ArtApp(root)  # Create the application instance.
+    app = ArtApp(root, gesture_source=gesture_source, metrics=metrics, backend_options=backend_options(args),
+                 motion_threshold=args.motion_threshold,
+                 visitor_idle_timeout=args.visitor_timeout)  # Create the application instance.
     root.mainloop()  # Runs the main loop of the application.
+    if exporter is not None:
+        exporter.stop()
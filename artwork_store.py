@@ -0,0 +1,152 @@
+# We import the modules needed to build and read the multi-resolution store of the gallery's paintings.
+import argparse
+import glob
+import json
+import os
+import threading
+from PIL import Image
+
+# The directory with the paintings and the directory in which their smaller renditions are stored.
+IMAGES_DIR = 'images'
+MIPMAPS_DIR = os.path.join(IMAGES_DIR, 'mipmaps')
+MANIFEST_PATH = os.path.join(MIPMAPS_DIR, 'manifest.json')
+
+# The renditions are halved in size until their longest side would be smaller than this.
+MIN_LEVEL_SIZE = 256
+
+# The file extensions of the paintings included in the store.
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+# We define the loader of the store, which picks the smallest rendition of a painting that covers a given size.
+class ArtworkStore:
+    def __init__(self, manifest_path: str = MANIFEST_PATH):
+        self.manifest_path = manifest_path
+        self.entries = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        self._checked = set()  # Paths whose entry was checked against the original file and the renditions.
+        # The entries are checked both by the prefetching thread of the image cache and by the Tk thread.
+        self._lock = threading.Lock()
+
+    # Function to get the entry of a painting, or None if it is not in the store, the original has changed since
+    # or a rendition is missing.
+    def entry(self, path):
+        with self._lock:
+            entry = self.entries.get(path)
+            if entry is not None and path not in self._checked:
+                if not _is_up_to_date(path, entry):
+                    print(f"Warning: {path} changed since the mipmaps were built; using the original.")
+                    self.entries.pop(path, None)
+                    return None
+                if not all(os.path.exists(level['path']) for level in entry['levels']):
+                    print(f"Warning: a mipmap of {path} is missing; using the original.")
+                    self.entries.pop(path, None)
+                    return None
+                self._checked.add(path)
+            return entry
+
+    # Function to get the dimensions of the original painting without opening it, or None if it is unknown.
+    def image_size(self, path):
+        entry = self.entry(path)
+        return (entry['width'], entry['height']) if entry is not None else None
+
+    # Function to get the file of the smallest rendition at least as large as the given size.
+    # The original is returned if no rendition covers the size or the painting is not in the store.
+    def source_for(self, path, size):
+        entry = self.entry(path)
+        if entry is None:
+            return path
+        # The levels are sorted from the smallest to the largest.
+        for level in entry['levels']:
+            if level['width'] >= size[0] and level['height'] >= size[1]:
+                return level['path']
+        return path
+
+    # Function to get the file of the smallest rendition of a painting, used for quick previews.
+    def smallest_source(self, path):
+        entry = self.entry(path)
+        if entry is None or not entry['levels']:
+            return path
+        return entry['levels'][0]['path']
+
+
+# Function to check whether an entry of the manifest was built from the current version of the original file.
+def _is_up_to_date(path, entry):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    return stat.st_size == entry['source_size'] and int(stat.st_mtime) == entry['source_mtime']
+
+
+# Function to build the renditions of one painting and return its manifest entry.
+def build_levels(path, output_dir, min_level_size: int = MIN_LEVEL_SIZE, quality: int = 90):
+    stat = os.stat(path)
+    with Image.open(path) as original:
+        original.load()
+        if original.mode not in ('RGB', 'L'):
+            original = original.convert('RGB')
+        width, height = original.size
+
+        os.makedirs(output_dir, exist_ok=True)
+        levels = []
+        level_width, level_height = width // 2, height // 2
+        while max(level_width, level_height) >= min_level_size:
+            level_path = os.path.join(output_dir, f"{level_width}x{level_height}.jpg")
+            # Each level is resampled from the original to avoid accumulating resampling errors.
+            original.resize((level_width, level_height), Image.LANCZOS).save(level_path, quality=quality)
+            levels.append({'path': level_path.replace(os.sep, '/'), 'width': level_width, 'height': level_height})
+            level_width, level_height = level_width // 2, level_height // 2
+
+    # The levels are stored from the smallest to the largest.
+    levels.reverse()
+    return {
+        'width': width,
+        'height': height,
+        'aspect_ratio': width / height,
+        'source_size': stat.st_size,
+        'source_mtime': int(stat.st_mtime),
+        'levels': levels,
+    }
+
+
+# Function to build the store for all paintings in the images directory, skipping the ones that are up to date.
+def build_store(images_dir: str = IMAGES_DIR, mipmaps_dir: str = MIPMAPS_DIR, manifest_path: str = MANIFEST_PATH,
+                min_level_size: int = MIN_LEVEL_SIZE, force: bool = False):
+    manifest = {}
+    if os.path.exists(manifest_path) and not force:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+    paths = sorted(path.replace(os.sep, '/') for path in glob.glob(os.path.join(images_dir, '*'))
+                   if path.lower().endswith(IMAGE_EXTENSIONS))
+    for path in paths:
+        if path in manifest and _is_up_to_date(path, manifest[path]):
+            continue
+        stem = os.path.splitext(os.path.basename(path))[0]
+        manifest[path] = build_levels(path, os.path.join(mipmaps_dir, stem), min_level_size)
+        print(f"{path}: {len(manifest[path]['levels'])} renditions")
+
+    # We drop the paintings that were removed, and write the manifest atomically.
+    manifest = {path: manifest[path] for path in paths}
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, manifest_path)
+    print(f"Manifest of {len(manifest)} paintings written to {manifest_path}.")
+
+
+# If the file is run directly, we build the renditions of the paintings in the images directory.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the multi-resolution renditions of the gallery's paintings.")
+    parser.add_argument('--images-dir', default=IMAGES_DIR)
+    parser.add_argument('--min-level-size', type=int, default=MIN_LEVEL_SIZE,
+                        help="Smallest longest side of a rendition, in pixels.")
+    parser.add_argument('--force', action='store_true', help="Rebuild the renditions of every painting.")
+    args = parser.parse_args()
+    mipmaps_dir = os.path.join(args.images_dir, 'mipmaps')
+    build_store(args.images_dir, mipmaps_dir, os.path.join(mipmaps_dir, 'manifest.json'), args.min_level_size,
+                args.force)
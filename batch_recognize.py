@@ -0,0 +1,175 @@
+# We import the modules needed to recognize the gestures in recorded videos, without a camera or a display.
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+# The label of the frames without a hand, and the maximum number of hands mediapipe looks for.
+NO_GESTURE = "None"
+MAX_HANDS = 2
+
+# The number of frames whose hands are classified together in one batched prediction.
+CHUNK_FRAMES = 256
+
+
+# Function to recognize the gestures in every frame of a video and save them in a compressed .npz file.
+# The frames are decoded one at a time, so the memory use does not depend on the length of the video.
+# The file contains, for each frame:
+#   frame_idx, timestamp_ms: the index and the position in the video of the frame,
+#   hand_count: the number of hands detected,
+#   landmarks: (MAX_HANDS, 21, 3) float32 landmark coordinates, NaN for missing hands,
+#   gesture_ids, confidences: the gesture of each hand and its confidence (-1 and NaN for missing hands),
+#   smoothed_ids: the smoothed gesture of the frame, as returned by GestureDetectorLogger.detect_and_log,
+# and labels, the names of the gesture ids, where 0 is "None".
+# The gestures are recognized by the backend of gesture_backends.py selected by backend_options.
+def recognize_video(path, output_dir, chunk_frames: int = CHUNK_FRAMES, backend_options=None):
+    import cv2
+    from gesture_backends import create_backend, video_backend_options
+    from gesture_detector import NUM_HAND_LANDMARKS, NUM_LANDMARK_FEATURES
+
+    start = time.perf_counter()
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise OSError(f"Could not open {path}.")
+    detector = create_backend(**video_backend_options(backend_options))
+    labels = [NO_GESTURE] + [label for label in detector.labels if label != NO_GESTURE]
+    label_ids = {label: i for i, label in enumerate(labels)}
+
+    columns = {name: [] for name in ('frame_idx', 'timestamp_ms', 'hand_count', 'landmarks', 'gesture_ids',
+                                     'confidences', 'smoothed_ids')}
+    landmarks = np.empty((chunk_frames, MAX_HANDS, NUM_HAND_LANDMARKS, 3), dtype=np.float32)
+    timestamps = np.empty(chunk_frames)
+    hand_counts = np.empty(chunk_frames, dtype=np.uint8)
+    # The gestures of the hands recognized by the backend itself, and whether each frame still needs its hands
+    # classified, which the hands backend does for all the buffered frames at once.
+    gesture_ids = np.empty((chunk_frames, MAX_HANDS), dtype=np.int8)
+    confidences = np.empty((chunk_frames, MAX_HANDS), dtype=np.float32)
+    unclassified = np.empty(chunk_frames, dtype=bool)
+
+    # Function to classify the hands of the buffered frames in one batch and append the chunk to the columns.
+    def flush_chunk(first_frame, n_frames):
+        present = (np.arange(MAX_HANDS) < hand_counts[:n_frames, None]) & unclassified[:n_frames, None]
+        if present.any():
+            features = landmarks[:n_frames].reshape(n_frames, MAX_HANDS, NUM_LANDMARK_FEATURES)[present]
+            gestures, hand_confidences = detector.classify_hands(features)
+            gesture_ids[:n_frames][present] = [label_ids[str(gesture)] for gesture in gestures]
+            confidences[:n_frames][present] = hand_confidences
+
+        # The smoothing follows the frames in order, with the gesture of the last hand as in detect_and_log.
+        smoothed_ids = np.empty(n_frames, dtype=np.int8)
+        for i in range(n_frames):
+            # A frame without hand (or a hand without score) has no confidence, see GestureSmoother.
+            gesture, confidence = NO_GESTURE, None
+            if hand_counts[i]:
+                last_hand = hand_counts[i] - 1
+                gesture = labels[gesture_ids[i, last_hand]]
+                if not np.isnan(confidences[i, last_hand]):
+                    confidence = float(confidences[i, last_hand])
+            smoothed_ids[i] = label_ids[detector.smoother.update(gesture, confidence)]
+
+        columns['frame_idx'].append(np.arange(first_frame, first_frame + n_frames, dtype=np.int32))
+        columns['timestamp_ms'].append(timestamps[:n_frames].copy())
+        columns['hand_count'].append(hand_counts[:n_frames].copy())
+        columns['landmarks'].append(landmarks[:n_frames].copy())
+        columns['gesture_ids'].append(gesture_ids[:n_frames].copy())
+        columns['confidences'].append(confidences[:n_frames].copy())
+        columns['smoothed_ids'].append(smoothed_ids)
+
+    frame_idx = 0
+    n_buffered = 0
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            timestamps[n_buffered] = cap.get(cv2.CAP_PROP_POS_MSEC)
+            hands, gestures, hand_confidences = detector.detect_hands(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB),
+                                                                      timestamps[n_buffered])
+            hands = hands[:MAX_HANDS]
+            hand_counts[n_buffered] = len(hands)
+            landmarks[n_buffered] = np.nan
+            landmarks[n_buffered, :len(hands)] = hands
+            gesture_ids[n_buffered] = -1
+            confidences[n_buffered] = np.nan
+            unclassified[n_buffered] = gestures is None
+            if gestures is not None:
+                gesture_ids[n_buffered, :len(hands)] = [label_ids[gesture] for gesture in gestures[:MAX_HANDS]]
+                confidences[n_buffered, :len(hands)] = hand_confidences[:MAX_HANDS]
+            n_buffered += 1
+            frame_idx += 1
+            if n_buffered == chunk_frames:
+                flush_chunk(frame_idx - n_buffered, n_buffered)
+                n_buffered = 0
+        if n_buffered:
+            flush_chunk(frame_idx - n_buffered, n_buffered)
+    finally:
+        cap.release()
+        detector.close()
+
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = output_path_for(path, output_dir)
+    arrays = {name: np.concatenate(chunks) if chunks else np.empty(0) for name, chunks in columns.items()}
+    np.savez_compressed(output_path, labels=np.array(labels), **arrays)
+
+    elapsed = time.perf_counter() - start
+    video_seconds = arrays['timestamp_ms'][-1] / 1000 if frame_idx else 0.0
+    return output_path, frame_idx, elapsed, video_seconds
+
+
+# Function to get the file in which the gestures of a video are saved, named after the video.
+def output_path_for(path, output_dir):
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0] + '.gestures.npz')
+
+
+# Function to check that no two videos are saved to the same file, such as a/clip.mp4 and b/clip.avi,
+# which would overwrite each other. A ValueError lists the videos that collide. It returns the paths without
+# the videos given more than once, which are processed once.
+def check_output_paths(paths, output_dir):
+    unique_paths = {}
+    for path in paths:
+        unique_paths.setdefault(os.path.abspath(path), path)
+    videos = {}
+    for path in unique_paths.values():
+        videos.setdefault(output_path_for(path, output_dir), []).append(path)
+    collisions = [f"{', '.join(sources)} -> {output_path}" for output_path, sources in videos.items()
+                  if len(sources) > 1]
+    if collisions:
+        raise ValueError("Videos with the same name would be saved to the same file; rename them or process them "
+                         "with different output directories: " + '; '.join(collisions))
+    return list(unique_paths.values())
+
+
+# Function to recognize the gestures of several videos in parallel, one process per video at a time.
+def recognize_videos(paths, output_dir, workers=None, backend_options=None):
+    paths = check_output_paths(paths, output_dir)
+    # We use spawned processes, which do not share the state of mediapipe.
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = {executor.submit(recognize_video, path, output_dir, CHUNK_FRAMES, backend_options): path
+                   for path in paths}
+        for future in as_completed(futures):
+            try:
+                output_path, n_frames, elapsed, video_seconds = future.result()
+            except Exception as e:
+                print(f"Error: Could not process {futures[future]}: {e}")
+                continue
+            speed = f", {video_seconds / elapsed:.1f}x real time" if video_seconds else ""
+            print(f"{futures[future]}: {n_frames} frames in {elapsed:.1f} s ({n_frames / elapsed:.0f} fps{speed})"
+                  f" -> {output_path}")
+
+
+# If the file is run directly, we recognize the gestures of the videos given on the command line.
+if __name__ == "__main__":
+    from gesture_backends import add_backend_arguments, backend_options
+    parser = argparse.ArgumentParser(description="Recognize the gestures in recorded videos, without a display.")
+    parser.add_argument('videos', nargs='+', help="Video files to process.")
+    parser.add_argument('--output-dir', default='recognitions', help="Directory of the .gestures.npz files.")
+    parser.add_argument('--workers', type=int, default=None, help="Number of videos processed in parallel.")
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+    try:
+        recognize_videos(args.videos, args.output_dir, args.workers, backend_options(args))
+    except ValueError as e:
+        parser.error(str(e))
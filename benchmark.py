@@ -0,0 +1,237 @@
+# We import the modules needed to measure the latency and throughput of each stage of the gesture pipeline.
+import argparse
+import glob
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+# The size of the synthetic frames used when no recording is given.
+SYNTHETIC_FRAME_SIZE = (480, 640)
+
+
+# Function to call fn on every input, repeat times over, and return the duration of each call in seconds.
+def time_calls(fn, inputs, repeat: int = 1):
+    durations = []
+    for _ in range(repeat):
+        for item in inputs:
+            start = time.perf_counter()
+            fn(item)
+            durations.append(time.perf_counter() - start)
+    return np.array(durations)
+
+
+# Function to measure the peak memory allocated by Python while calling fn on the inputs once.
+def peak_allocation(fn, inputs):
+    tracemalloc.start()
+    try:
+        for item in inputs:
+            fn(item)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+# Function to benchmark one stage and summarize its latency percentiles, throughput and memory.
+def benchmark_stage(name, fn, inputs, repeat: int, warmup: int = 3):
+    inputs = list(inputs)
+    for item in inputs[:warmup]:
+        fn(item)
+    durations = time_calls(fn, inputs, repeat)
+    p50, p95, p99 = np.percentile(durations, [50, 95, 99]) * 1000
+    return {
+        'stage': name,
+        'calls': len(durations),
+        'p50_ms': p50,
+        'p95_ms': p95,
+        'p99_ms': p99,
+        'fps': len(durations) / durations.sum(),
+        'peak_alloc_kb': peak_allocation(fn, inputs[:10]) / 1024,
+    }
+
+
+# Function to load up to max_frames BGR frames from a video file or a directory of images.
+# Without a recording, synthetic noise frames are used, which still exercise every stage.
+def load_frames(video=None, frames_dir=None, max_frames: int = 100):
+    import cv2
+    frames = []
+    if video is not None:
+        cap = cv2.VideoCapture(video)
+        while len(frames) < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+    elif frames_dir is not None:
+        for path in sorted(glob.glob(os.path.join(frames_dir, '*')))[:max_frames]:
+            frame = cv2.imread(path)
+            if frame is not None:
+                frames.append(frame)
+    else:
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 256, (*SYNTHETIC_FRAME_SIZE, 3), dtype=np.uint8) for _ in range(max_frames)]
+    if not frames:
+        raise ValueError("No frames could be loaded.")
+    return frames
+
+
+# Function to load recorded sets of hand landmarks, as (n, 21, 3) arrays, from a .gestures.npz file written by
+# batch_recognize.py or from the collected gesture dataset.
+def load_landmark_sets(path='gesture_dataset', max_sets: int = 1000):
+    if path.endswith('.npz'):
+        with np.load(path) as data:
+            landmarks = data['landmarks'][data['hand_count'] > 0][:, 0]
+    else:
+        from gesture_dataset import load_dataset
+        landmarks = load_dataset(path).landmarks()
+    return np.array(landmarks[:max_sets])
+
+
+# Function to build mediapipe landmark messages from landmark arrays, like the ones hands.process returns.
+def to_landmark_lists(landmark_sets):
+    from mediapipe.framework.formats import landmark_pb2
+    messages = []
+    for landmarks in landmark_sets:
+        message = landmark_pb2.NormalizedLandmarkList()
+        for x, y, z in landmarks:
+            message.landmark.add(x=x, y=y, z=z)
+        messages.append(message)
+    return messages
+
+
+# Function to load the paintings rendered by the gallery, or a synthetic painting if there are none.
+def load_painting_paths(images_dir='images', scratch_dir='.benchmark'):
+    paths = sorted(glob.glob(os.path.join(images_dir, '*.jpg')))
+    if not paths:
+        from PIL import Image
+        os.makedirs(scratch_dir, exist_ok=True)
+        path = os.path.join(scratch_dir, 'synthetic.jpg')
+        if not os.path.exists(path):
+            rng = np.random.default_rng(0)
+            Image.fromarray(rng.integers(0, 256, (2000, 3000, 3), dtype=np.uint8)).save(path)
+        paths = [path]
+    return paths
+
+
+# Function to run the benchmark of every stage of the pipeline and return the results.
+# The recognition backend of gesture_backends.py is selected by backend_options.
+def run_benchmark(frames, landmark_sets, painting_paths, repeat: int = 3, window_size=(800, 550),
+                  backend_options=None):
+    import cv2
+    from gesture_backends import create_backend, video_backend_options
+    from gesture_detector import GestureSmoother, landmarks_to_array
+    from gesture_features import landmark_features
+    from motion_gate import MotionGate
+
+    detector = create_backend(**video_backend_options(backend_options))
+    results = []
+
+    # Stages that work on camera frames. With the recognizer backend, hands_process also classifies the gestures.
+    results.append(benchmark_stage('color_conversion', lambda frame: cv2.cvtColor(frame, cv2.COLOR_BGR2RGB),
+                                   frames, repeat))
+    rgb_frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in frames]
+    hands_process = detector.hands.process if hasattr(detector, 'hands') else detector.detect_hands
+    results.append(benchmark_stage('hands_process', hands_process, rgb_frames, 1))
+    results.append(benchmark_stage('detect_and_log', lambda frame: detector.detect_and_log(frame.copy(), 0),
+                                   frames, 1))
+    gate = MotionGate()
+    results.append(benchmark_stage('motion_gate', gate.should_process, frames, repeat))
+
+    # Stages that work on recorded landmarks, one hand per frame. They are those of the trained model, which the
+    # recognizer backend does not use.
+    if hasattr(detector, 'classify'):
+        hands = [[message] for message in to_landmark_lists(landmark_sets)]
+        buffer = np.empty((2, landmark_sets.shape[1] * 3), dtype=np.float32)
+        results.append(benchmark_stage('landmark_extraction', lambda hand: landmarks_to_array(hand, buffer),
+                                       hands, repeat))
+        features = [landmarks_to_array(hand) for hand in hands]
+        results.append(benchmark_stage('features', lambda feature: landmark_features(feature, detector.feature_set),
+                                       features, repeat))
+        results.append(benchmark_stage('predict', detector.classify, features, repeat))
+        gestures = [detector.classify(feature) for feature in features]
+        smoother = GestureSmoother()
+        results.append(benchmark_stage('smoothing', lambda gesture: smoother.update(*gesture), gestures, repeat))
+    detector.close()
+    results.extend(benchmark_rendering(painting_paths, repeat, window_size))
+    return results
+
+
+# Function to benchmark the rendering of the paintings and return the results.
+def benchmark_rendering(painting_paths, repeat: int, window_size):
+    from image_cache import ImageCache
+
+    results = []
+    # Rendering of the paintings at the window size, from disk (cold cache) and from the cache (warm cache).
+    cold_cache = ImageCache()
+
+    def render_cold(path):
+        cold_cache.renditions.clear()
+        cold_cache.decoded.clear()
+        cold_cache.rendition(path, cold_cache.display_size(path, *window_size))
+    results.append(benchmark_stage('render_cold', render_cold, painting_paths, repeat, warmup=0))
+    warm_cache = ImageCache()
+    results.append(benchmark_stage('render_cached',
+                                   lambda path: warm_cache.rendition(path, warm_cache.display_size(path, *window_size)),
+                                   painting_paths, repeat))
+    cold_cache.close()
+    warm_cache.close()
+    return results
+
+
+# Function to print the results as a table.
+def print_results(results):
+    print(f"{'stage':<20} {'calls':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'fps':>10} {'peak KB':>9}")
+    for r in results:
+        print(f"{r['stage']:<20} {r['calls']:>6} {r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f} {r['p99_ms']:>9.3f}"
+              f" {r['fps']:>10.1f} {r['peak_alloc_kb']:>9.1f}")
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 if sys.platform != 'darwin' else 1024 ** 2)
+    print(f"Peak resident memory: {max_rss:.0f} MB")
+
+
+# Function to compare the results with a baseline and return the stages whose p95 latency regressed.
+def find_regressions(results, baseline, tolerance: float):
+    baseline_by_stage = {r['stage']: r for r in baseline}
+    regressions = []
+    for r in results:
+        reference = baseline_by_stage.get(r['stage'])
+        if reference is not None and r['p95_ms'] > reference['p95_ms'] * (1 + tolerance):
+            regressions.append((r['stage'], reference['p95_ms'], r['p95_ms']))
+    return regressions
+
+
+# If the file is run directly, we benchmark the pipeline and optionally compare it with a baseline.
+if __name__ == "__main__":
+    from gesture_backends import add_backend_arguments, backend_options
+    parser = argparse.ArgumentParser(description="Benchmark each stage of the gesture pipeline without a camera.")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--video', help="Video file whose frames are replayed.")
+    source.add_argument('--frames-dir', help="Directory of images replayed as frames.")
+    parser.add_argument('--landmarks', default='gesture_dataset',
+                        help="The gesture dataset directory or a .gestures.npz file from batch_recognize.py.")
+    parser.add_argument('--max-frames', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3, help="Number of passes over the inputs of fast stages.")
+    parser.add_argument('--json', help="File in which the results are saved.")
+    parser.add_argument('--baseline', help="Results of a previous run to compare with.")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed p95 increase over the baseline.")
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+
+    results = run_benchmark(load_frames(args.video, args.frames_dir, args.max_frames),
+                            load_landmark_sets(args.landmarks), load_painting_paths(), args.repeat,
+                            backend_options=backend_options(args))
+    print_results(results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for stage, before, after in regressions:
+            print(f"Regression: {stage} p95 went from {before:.3f} ms to {after:.3f} ms.")
+        sys.exit(1 if regressions else 0)
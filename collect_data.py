@@ -1,69 +1,153 @@
-# We import the necessary modules for video capture, image processing and data serialization.
+# We import the necessary modules for video capture, image processing and data storage.
+import argparse
+import getpass
+import os
+import threading
+import time
 import cv2
 import mediapipe as mp
-import pickle
+from gesture_dataset import DATASET_DIR, GESTURES, INDEX_FILE, LEGACY_DATA_PATH, GestureDataset, GestureDatasetWriter, \
+    migrate_pickle
+from gesture_pipeline import LatestFrameQueue
 
 # We initialize the hand detection solution in Mediapipe.
 mp_hands = mp.solutions.hands
-hands = mp_hands.Hands(static_image_mode=True, max_num_hands=1, min_detection_confidence=0.5)
 mp_drawing = mp.solutions.drawing_utils
 
-# We define the list of gestures that will be collected.
-gestures = ['Next', 'Previous', 'OK', 'Victory', 'Like', 'Dislike', 'Open Palm', 'Closed Palm']
 
-# We create a dictionary to store the data for each gesture.
-gesture_data = {gesture: [] for gesture in gestures}
+# We define the state of a collection session shared by the display loop and the collection thread.
+class CollectionState:
+    def __init__(self, counts):
+        self.gesture = None  # The gesture being collected, or None while paused.
+        self.counts = dict(counts)  # The number of samples of each gesture collected in the session.
+        self.lock = threading.Lock()
 
-# We initialize the video capture from the webcam.
-cap = cv2.VideoCapture(0)
 
-# We check if the webcam was opened successfully.
-if not cap.isOpened():
-    print("Error: Could not open webcam.")
-    exit()
-
-# We display instructions for the user.
-print("Press 'q' to quit.")
-
-# We go through every gesture to collect the data.
-for gesture in gestures:
-    print(f"Perform the gesture: {gesture}")
-    input("Press Enter to start collecting data...")
-
-    while True:
+# Function run by the collection thread: it reads the frames, detects the hands and, while a gesture is being
+# collected, appends their landmarks to the dataset. The annotated frames are passed to the display loop, so
+# the capture rate does not depend on how fast the frames are displayed.
+def collect_frames(cap, hands, writer, state, display_frames, stop_event):
+    while not stop_event.is_set():
         # We read a frame from the webcam.
         ret, frame = cap.read()
         if not ret:
             print("Error: Could not read frame from webcam.")
+            stop_event.set()
             break
+        timestamp = time.time()
 
         # We convert the image from BGR to RGB for Mediapipe processing.
-        image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = hands.process(image_rgb)
+        results = hands.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
 
         # We check if hands have been detected in the image.
         if results.multi_hand_landmarks:
-            for hand_landmarks in results.multi_hand_landmarks:
-                # We extract the hand landmark coordinates and add them to the data dictionary.
-                landmarks = [[lm.x, lm.y, lm.z] for lm in hand_landmarks.landmark]
-                gesture_data[gesture].append(landmarks)
-                # We draw the landmarks on the frame to visualize them.
-                mp_drawing.draw_landmarks(frame, hand_landmarks, mp_hands.HAND_CONNECTIONS)
-
-        # We display the updated frame.
-        cv2.imshow('Collecting Data', frame)
-        # We check if the user pressed the 'q' key to stop data collection.
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+            handedness = [classification.classification[0].label
+                          for classification in results.multi_handedness or []]
+            with state.lock:
+                for i, hand_landmarks in enumerate(results.multi_hand_landmarks):
+                    if state.gesture is not None:
+                        # We extract the hand landmark coordinates and add them to the dataset.
+                        landmarks = [[lm.x, lm.y, lm.z] for lm in hand_landmarks.landmark]
+                        writer.append(state.gesture, landmarks, handedness[i] if i < len(handedness) else None,
+                                      timestamp)
+                        state.counts[state.gesture] += 1
+                    # We draw the landmarks on the frame to visualize them.
+                    mp_drawing.draw_landmarks(frame, hand_landmarks, mp_hands.HAND_CONNECTIONS)
+
+        display_frames.put(frame)
+    display_frames.close()
+
+
+# Function to run a collection session. Each gesture is collected until it has samples_per_gesture samples in
+# the session; when a session is resumed, the gestures that already have enough samples are skipped.
+def run_session(session_name, collector, gestures, samples_per_gesture: int, path=DATASET_DIR):
+    # We convert the data collected by the previous versions of this script, so that it is kept.
+    if not os.path.exists(os.path.join(path, INDEX_FILE)) and os.path.exists(LEGACY_DATA_PATH):
+        migrate_pickle(LEGACY_DATA_PATH, path)
+
+    # We count the samples the session already has, if it is resumed.
+    dataset = GestureDataset(path) if os.path.exists(os.path.join(path, INDEX_FILE)) else None
+    session_id = dataset.session_id(session_name) if dataset is not None else None
+    counts = dataset.counts(session_id) if session_id is not None else {}
+    state = CollectionState({gesture: counts.get(gesture, 0) for gesture in gestures})
+    del dataset
+
+    # We open the dataset, to which the samples are appended and written to disk in chunks as they are collected.
+    writer = GestureDatasetWriter(path, gestures, chunk_size=256)
+    writer.start_session(session_name, collector=collector)
+    if session_id is not None:
+        print(f"Resuming session {session_name}: {state.counts}")
+
+    # We initialize the video capture from the webcam.
+    cap = cv2.VideoCapture(0)
+
+    # We check if the webcam was opened successfully.
+    if not cap.isOpened():
+        print("Error: Could not open webcam.")
+        return
+
+    hands = mp_hands.Hands(static_image_mode=True, max_num_hands=1, min_detection_confidence=0.5)
+    display_frames = LatestFrameQueue(maxsize=1)
+    stop_event = threading.Event()
+    collection_thread = threading.Thread(target=collect_frames, name="collect-frames", daemon=True,
+                                         args=(cap, hands, writer, state, display_frames, stop_event))
+    collection_thread.start()
+
+    # We display instructions for the user.
+    print("Press 's' to start or pause collecting a gesture, 'n' to skip to the next gesture and 'q' to quit.")
+    print("The session can be resumed later with the same session name.")
+
+    try:
+        # We go through every gesture that still needs samples.
+        for gesture in gestures:
+            if state.counts[gesture] >= samples_per_gesture:
+                continue
+            print(f"Perform the gesture: {gesture} ({state.counts[gesture]}/{samples_per_gesture} samples)")
+
+            while not stop_event.is_set() and state.counts[gesture] < samples_per_gesture:
+                # We display the latest annotated frame with the progress of the gesture.
+                frame = display_frames.get(timeout=0.1)
+                if frame is not None:
+                    status = f"{gesture}: {state.counts[gesture]}/{samples_per_gesture}"
+                    status += "" if state.gesture is not None else " (paused, press 's')"
+                    cv2.putText(frame, status, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+                    cv2.imshow('Collecting Data', frame)
+
+                key = cv2.waitKey(1) & 0xFF
+                if key == ord('s'):
+                    with state.lock:
+                        state.gesture = gesture if state.gesture is None else None
+                elif key == ord('n'):
+                    break
+                elif key == ord('q'):
+                    stop_event.set()
 
-# We release the webcam resources and close all OpenCV windows.
-cap.release()
-cv2.destroyAllWindows()
+            # We stop collecting the gesture and write its samples to disk.
+            with state.lock:
+                state.gesture = None
+                writer.flush()
+            if stop_event.is_set():
+                break
+    finally:
+        stop_event.set()
+        collection_thread.join()
+        # We release the webcam resources, close all OpenCV windows and write the samples that are still in memory.
+        cap.release()
+        cv2.destroyAllWindows()
+        writer.close()
 
-# We save the collected data in a binary file 'gesture_data.pkl'.
-with open('gesture_data.pkl', 'wb') as f:
-    pickle.dump(gesture_data, f)
+    # We display a confirmation message with the samples of the session.
+    print(f"Session {session_name}: {state.counts}. The dataset has {writer.samples_written} samples.")
 
-# We display a confirmation message that data collection is complete.
-print("Data collection complete.")
 
+# If the file is run directly, we start or resume a collection session.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collect hand landmarks for training the gesture model.")
+    parser.add_argument('--session', default=time.strftime('%Y%m%d-%H%M%S'),
+                        help="Name of the session; an existing session with this name is resumed.")
+    parser.add_argument('--collector', default=getpass.getuser(), help="Name of the person collecting the data.")
+    parser.add_argument('--gestures', nargs='+', default=GESTURES, help="Gestures to collect.")
+    parser.add_argument('--samples-per-gesture', type=int, default=300, help="Number of samples of each gesture.")
+    parser.add_argument('--dataset', default=DATASET_DIR, help="Directory of the dataset.")
+    args = parser.parse_args()
+    run_session(args.session, args.collector, args.gestures, args.samples_per_gesture, args.dataset)
@@ -0,0 +1,143 @@
+# We import the modules needed to store the evaluations of the paintings in an SQLite database.
+import os
+import pickle
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+# The database in which the evaluations are logged, and the pickle file used by earlier versions of the app.
+DATABASE_PATH = 'evaluations.db'
+LEGACY_PICKLE_PATH = 'evaluations.pkl'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS evaluations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    image TEXT NOT NULL,
+    rating TEXT NOT NULL,
+    visitor_id TEXT,
+    session_id TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS evaluations_by_image ON evaluations (image, id);
+CREATE TABLE IF NOT EXISTS migrations (
+    name TEXT PRIMARY KEY,
+    applied_at REAL NOT NULL
+);
+"""
+
+# The marker that stops the writer thread.
+_STOP = object()
+
+
+# Function to open a connection to the database. The write-ahead log keeps the database consistent on power loss.
+def _connect(path):
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    return connection
+
+
+# We define an append-only log of evaluations. Every evaluation is a new record with the visitor, the session
+# and the time, and the records are written in batches by a background thread, each batch in one transaction.
+class EvaluationStore:
+    def __init__(self, path: str = DATABASE_PATH, legacy_path: str = LEGACY_PICKLE_PATH,
+                 flush_interval: float = 1.0, image_prefix: str = 'images/'):
+        self.path = path
+        self.flush_interval = flush_interval  # Time in seconds during which evaluations are gathered into one batch.
+        self.visitor_id = None
+        self.session_id = None
+        self.start_session()
+
+        with _connect(path) as connection:
+            connection.executescript(_SCHEMA)
+        connection.close()
+        if os.path.exists(legacy_path):
+            self.migrate_pickle(legacy_path, image_prefix)
+
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="evaluation-writer", daemon=True)
+        self._writer.start()
+
+    # Function to start a new session, for example when a new visitor arrives.
+    def start_session(self, visitor_id=None):
+        self.visitor_id = visitor_id
+        self.session_id = uuid.uuid4().hex
+
+    # Function to import the evaluations of the pickle file written by earlier versions of the app, only once.
+    # The pickle stores the file names of the images without the directory, which is added back with image_prefix.
+    def migrate_pickle(self, legacy_path: str, image_prefix: str = 'images/'):
+        migration = f'pickle:{os.path.abspath(legacy_path)}'
+        connection = _connect(self.path)
+        try:
+            with connection:
+                if connection.execute('SELECT 1 FROM migrations WHERE name = ?', (migration,)).fetchone():
+                    return
+                with open(legacy_path, 'rb') as f:
+                    legacy_evaluations = pickle.load(f)
+                created_at = os.path.getmtime(legacy_path)
+                connection.executemany(
+                    'INSERT INTO evaluations (image, rating, visitor_id, session_id, created_at) VALUES (?, ?, ?, ?, ?)',
+                    [(image_prefix + image, rating, None, 'legacy', created_at)
+                     for image, rating in legacy_evaluations.items() if rating is not None])
+                connection.execute('INSERT INTO migrations (name, applied_at) VALUES (?, ?)',
+                                   (migration, time.time()))
+        finally:
+            connection.close()
+
+    # Function to get the latest rating of every image that has been evaluated.
+    def latest_ratings(self):
+        connection = _connect(self.path)
+        try:
+            rows = connection.execute(
+                'SELECT image, rating FROM evaluations WHERE id IN (SELECT MAX(id) FROM evaluations GROUP BY image)')
+            return dict(rows.fetchall())
+        finally:
+            connection.close()
+
+    # Function to log an evaluation. It returns immediately; the evaluation is written by the writer thread.
+    def record(self, image: str, rating: str):
+        self._queue.put((image, rating, self.visitor_id, self.session_id, time.time()))
+
+    # Function to wait until every evaluation logged so far has been written.
+    def flush(self):
+        self._queue.join()
+
+    # Function to write the remaining evaluations and stop the writer thread.
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+
+    def _write_loop(self):
+        connection = _connect(self.path)
+        try:
+            stopping = False
+            while not stopping:
+                batch = [self._queue.get()]
+                # We gather the evaluations that arrive shortly after the first one into the same transaction.
+                deadline = time.monotonic() + self.flush_interval
+                while batch[-1] is not _STOP:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+                if batch[-1] is _STOP:
+                    stopping = True
+                records = [record for record in batch if record is not _STOP]
+                try:
+                    with connection:
+                        connection.executemany(
+                            'INSERT INTO evaluations (image, rating, visitor_id, session_id, created_at) '
+                            'VALUES (?, ?, ?, ?, ?)', records)
+                except sqlite3.Error as e:
+                    print(f"Error: Could not save {len(records)} evaluations: {e}")
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+        finally:
+            connection.close()
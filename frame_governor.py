@@ -0,0 +1,86 @@
+# We import the modules needed to adapt the webcam frame rate and resolution to the activity in front of it.
+import threading
+import time
+import cv2
+
+# The capture resolutions the governor can switch between, from the highest to the lowest.
+RESOLUTIONS = [(1280, 720), (960, 540), (640, 480), (480, 360)]
+
+
+# We define the governor of the webcam loop. It runs at active_fps while a hand has been seen in the last
+# idle_after seconds and drops to idle_fps otherwise. While active, the frames are not read faster than
+# they can be processed, and the capture resolution is lowered when the processing time exceeds the target
+# latency, and raised again when there is enough headroom.
+class FrameRateGovernor:
+    def __init__(self, resolution=(640, 480), active_fps: float = 30.0, idle_fps: float = 2.0,
+                 idle_after: float = 10.0, target_latency: float = 0.05, resolutions=RESOLUTIONS,
+                 resolution_change_interval: float = 5.0):
+        self.active_fps = active_fps
+        self.idle_fps = idle_fps
+        self.idle_after = idle_after  # Time in seconds without a hand after which the loop becomes idle.
+        self.target_latency = target_latency  # Processing time per frame to hold, in seconds.
+        self.resolutions = list(resolutions)
+        self.resolution = tuple(resolution)
+        self.resolution_change_interval = resolution_change_interval  # Minimum time in seconds between changes.
+        self.processing_time = 0.0  # Exponential moving average of the processing time per frame, in seconds.
+        # The loop starts active, so that a visitor who is already there is noticed without delay.
+        self.last_hand_time = time.monotonic()
+        self._last_resolution_change = time.monotonic()
+        self._pending_resolution = None
+        self._lock = threading.Lock()
+
+    # Function to set the resolution and the frame rate of the webcam.
+    def configure(self, cap):
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.resolution[0])
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.resolution[1])
+        cap.set(cv2.CAP_PROP_FPS, self.active_fps)
+        # A small buffer avoids reading old frames after the loop has been waiting.
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+    # Function to report the outcome of processing a frame: whether a hand was seen and how long it took.
+    def report(self, hand_seen: bool, processing_time: float, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if hand_seen:
+                self.last_hand_time = now
+            self.processing_time = processing_time if self.processing_time == 0.0 else \
+                0.9 * self.processing_time + 0.1 * processing_time
+            # The resolution only matters, and the processing time is only representative, while a hand is present.
+            if self.is_active(now):
+                self._adapt_resolution(now)
+
+    # Function to check whether a hand was seen recently.
+    def is_active(self, now=None):
+        now = time.monotonic() if now is None else now
+        return now - self.last_hand_time <= self.idle_after
+
+    # Function to get the time to wait between two frames, in seconds.
+    def interval(self, now=None):
+        if not self.is_active(now):
+            return 1.0 / self.idle_fps
+        # Reading frames faster than they are processed only adds latency.
+        return max(1.0 / self.active_fps, self.processing_time)
+
+    # Function to apply a pending change of resolution to the webcam. It must be called by the capture loop.
+    def apply(self, cap):
+        with self._lock:
+            resolution, self._pending_resolution = self._pending_resolution, None
+        if resolution is not None:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, resolution[0])
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, resolution[1])
+            print(f"Capture resolution changed to {resolution[0]}x{resolution[1]}.")
+
+    def _adapt_resolution(self, now):
+        if now - self._last_resolution_change < self.resolution_change_interval or self.resolution not in self.resolutions:
+            return
+        index = self.resolutions.index(self.resolution)
+        if self.processing_time > self.target_latency and index + 1 < len(self.resolutions):
+            index += 1
+        elif self.processing_time < 0.5 * self.target_latency and index > 0:
+            index -= 1
+        else:
+            return
+        self.resolution = self._pending_resolution = self.resolutions[index]
+        self._last_resolution_change = now
+        # The processing time at the new resolution has to be measured again.
+        self.processing_time = 0.0
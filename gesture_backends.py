@@ -0,0 +1,244 @@
+# We import the modules needed to choose the gesture recognition backend of the gallery and of the offline tools.
+import json
+import os
+import threading
+import time
+import numpy as np
+from gesture_dataset import GESTURES
+
+# The recognition backends:
+#   hands: mediapipe's hand landmarks (mp.solutions.hands) classified by the trained gesture model, as done by
+#       GestureDetectorLogger in gesture_detector.py,
+#   recognizer: mediapipe's GestureRecognizer task (gesture_recognizer.py), which detects the hands and classifies
+#       their gestures with the model of a .task file, in the video or the live stream running mode.
+#
+# Every backend has the interface of GestureDetectorLogger that the pipelines use:
+#   detect_and_log(image, frame_idx): takes a BGR frame and returns the smoothed gesture,
+#   detect_hands(image_rgb, timestamp_ms): returns the (n, 21, 3) landmarks of the hands of an RGB frame and the
+#       gesture and confidence of each hand, or None for both if they are classified later with classify_hands(),
+#   labels: the gestures the backend returns, last_hand_count, smoother, metrics and close(),
+#   last_frame_processed: whether the hands were looked for in the last frame, which the hands backend skips
+#       when its motion gate sees no motion.
+BACKENDS = ('hands', 'recognizer')
+DEFAULT_BACKEND = 'hands'
+
+# The model file of the GestureRecognizer task, and its running modes.
+RECOGNIZER_MODEL_PATH = 'gesture_recognizer.task'
+RUNNING_MODES = ('video', 'live_stream')
+
+# The options of the recognizer backend that the hands backend does not have.
+RECOGNIZER_OPTIONS = ('model_path', 'running_mode', 'label_map', 'num_hands')
+
+# The gesture of the frames without a recognized gesture.
+NO_GESTURE = "None"
+
+# The gestures of the gallery that the canned gestures of the GestureRecognizer task are mapped to. Next, Previous
+# and OK have no canned equivalent, so they need a custom model trained on the gallery's gestures, whose labels
+# are kept as they are.
+CANNED_LABEL_MAP = {
+    'Thumb_Up': 'Like',
+    'Thumb_Down': 'Dislike',
+    'Victory': 'Victory',
+    'Open_Palm': 'Open Palm',
+    'Closed_Fist': 'Closed Palm',
+}
+
+
+# We define the mapping of the gestures of a backend onto the gestures of the gallery. The gallery's gestures are
+# mapped to themselves, the others with the given mapping or by default with CANNED_LABEL_MAP, and the gestures
+# that are not mapped, such as Pointing_Up, become "None".
+class LabelMap:
+    def __init__(self, mapping=None, labels=GESTURES):
+        self.labels = list(labels)
+        self.mapping = {label: label for label in self.labels}
+        self.mapping.update(CANNED_LABEL_MAP if mapping is None else mapping)
+        unknown = set(self.mapping.values()) - set(self.labels) - {NO_GESTURE}
+        if unknown:
+            raise ValueError(f"Gestures mapped to unknown gallery gestures: {sorted(unknown)}")
+
+    # Function to load a mapping saved as a JSON object of {"backend gesture": "gallery gesture"}.
+    @classmethod
+    def load(cls, path, labels=GESTURES):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f), labels)
+
+    # Function to get the gallery gesture of a gesture of the backend.
+    def gesture(self, name):
+        return self.mapping.get(name, NO_GESTURE)
+
+
+# We define the backend running the GestureRecognizer task. In the video mode, every frame is recognized before
+# detect_and_log returns. In the live stream mode, the frames are sent to mediapipe, which may drop some of them
+# to keep up, and the results are received on mediapipe's thread; detect_and_log returns immediately with the
+# gesture smoothed over the results received so far.
+class RecognizerBackend:
+    def __init__(self, model_path=RECOGNIZER_MODEL_PATH, running_mode: str = 'video', label_map=None,
+                 num_hands: int = 1, smoothing_window: int = 5, hysteresis: float = 0.0,
+                 confidence_weighting: bool = True, metrics=None):
+        # The model is not part of the repository; the README explains where to get or how to train one.
+        if not os.path.isfile(model_path):
+            raise FileNotFoundError(f"The model of the recognizer backend, {model_path}, does not exist. Download "
+                                    "the canned gesture_recognizer.task or train one (see Recognition Backends in "
+                                    "the README), and give its path with --recognizer-model.")
+        import mediapipe as mp
+        from mediapipe.tasks.python.core.base_options import BaseOptions
+        from mediapipe.tasks.python.vision.core.vision_task_running_mode import VisionTaskRunningMode
+        from gesture_detector import GestureSmoother
+        from gesture_metrics import PipelineMetrics
+        from gesture_recognizer import GestureRecognizer, GestureRecognizerOptions
+
+        if running_mode not in RUNNING_MODES:
+            raise ValueError(f"Unknown running mode: {running_mode}")
+        self._mp = mp
+        self.running_mode = running_mode
+        self.label_map = label_map if label_map is not None else LabelMap()
+        self.labels = list(self.label_map.labels)
+        self.confidence_weighting = confidence_weighting
+        self.smoother = GestureSmoother(smoothing_window, hysteresis)
+        self.last_hand_count = 0
+        self.last_frame_processed = True  # Every frame is recognized.
+        self.metrics = metrics if metrics is not None else PipelineMetrics(enabled=False)
+        # In the live stream mode, the results update the smoother on mediapipe's thread.
+        self._lock = threading.Lock()
+        self._last_timestamp_ms = -1
+        self._image_rgb = None  # The RGB conversion of the frame, reused for every frame in the video mode.
+
+        # The results are NumPy arrays rather than a Python object per landmark.
+        live_stream = running_mode == 'live_stream'
+        options = GestureRecognizerOptions(
+            base_options=BaseOptions(model_asset_path=model_path),
+            running_mode=VisionTaskRunningMode.LIVE_STREAM if live_stream else VisionTaskRunningMode.VIDEO,
+            num_hands=num_hands, result_callback=self._on_result if live_stream else None, output_arrays=True)
+        self.recognizer = GestureRecognizer.create_from_options(options)
+
+    # Function to get the timestamp of a frame, in milliseconds. mediapipe requires strictly increasing timestamps,
+    # so a frame with the same or an earlier timestamp than the previous one gets the next millisecond.
+    def _timestamp_ms(self, timestamp_ms=None):
+        if timestamp_ms is None:
+            timestamp_ms = time.monotonic() * 1000
+        self._last_timestamp_ms = max(int(timestamp_ms), self._last_timestamp_ms + 1)
+        return self._last_timestamp_ms
+
+    # Function to get the landmarks of the hands of a result, with the gallery gesture of each and its confidence.
+    def _hands(self, result):
+        names, scores = result.top_gestures()
+        gestures = [self.label_map.gesture(name) for name in names]
+        # A hand without any gesture has no score (NaN); it votes for "None" like a frame without hand.
+        confidences = scores if self.confidence_weighting else np.ones(len(gestures))
+        return result.hand_landmarks, gestures, confidences
+
+    # Function to add the gesture of the last hand of a result to the smoother, as done by GestureDetectorLogger.
+    def _update(self, result):
+        _, gestures, confidences = self._hands(result)
+        with self._lock:
+            self.last_hand_count = len(gestures)
+            if gestures and not np.isnan(confidences[-1]):
+                self.smoother.update(gestures[-1], float(confidences[-1]))
+            else:
+                self.smoother.update(gestures[-1] if gestures else NO_GESTURE)
+            gesture = self.smoother.current
+        if gestures:
+            self.metrics.increment('hands', len(gestures))
+            self.metrics.increment('predictions', len(gestures))
+        return gesture
+
+    # Function called by mediapipe with the result of a frame in the live stream mode.
+    def _on_result(self, result, image, timestamp_ms):
+        self._update(result)
+
+    # Function to recognize the gesture of a BGR frame and return the smoothed gesture.
+    def detect_and_log(self, image, frame_idx: int) -> str:
+        from gesture_detector import bgr_to_rgb
+        metrics = self.metrics
+        frame_start = t = metrics.start()
+        if self.running_mode == 'live_stream':
+            # The frame is recognized on mediapipe's thread after recognize_async returns, so every frame gets
+            # its own RGB buffer, which the next frame cannot overwrite while it is in flight.
+            mp_image = self._mp.Image(image_format=self._mp.ImageFormat.SRGB, data=bgr_to_rgb(image))
+            t = metrics.lap('color_conversion', t)
+            self.recognizer.recognize_async(mp_image, self._timestamp_ms())
+            metrics.lap('recognize_async', t)
+            with self._lock:
+                gesture = self.smoother.current
+        else:
+            # The frame is recognized before recognize_for_video returns, so the RGB buffer is reused.
+            self._image_rgb = bgr_to_rgb(image, self._image_rgb)
+            mp_image = self._mp.Image(image_format=self._mp.ImageFormat.SRGB, data=self._image_rgb)
+            t = metrics.lap('color_conversion', t)
+            result = self.recognizer.recognize_for_video(mp_image, self._timestamp_ms())
+            t = metrics.lap('recognize', t)
+            gesture = self._update(result)
+            metrics.lap('smoothing', t)
+        metrics.end_frame(frame_start)
+        return gesture
+
+    # Function to recognize the hands of an RGB frame of a video, at the given position in milliseconds.
+    # It is only available in the video mode, where the result is returned by mediapipe.
+    def detect_hands(self, image_rgb, timestamp_ms=None):
+        if self.running_mode != 'video':
+            raise ValueError("detect_hands() needs the video running mode.")
+        mp_image = self._mp.Image(image_format=self._mp.ImageFormat.SRGB, data=np.ascontiguousarray(image_rgb))
+        return self._hands(self.recognizer.recognize_for_video(mp_image, self._timestamp_ms(timestamp_ms)))
+
+    # Function to stop the recognizer and its thread.
+    def close(self):
+        self.recognizer.close()
+
+
+# Function to create a backend by name with its options. The metrics are shared by all backends.
+def create_backend(backend: str = DEFAULT_BACKEND, metrics=None, **options):
+    if backend == 'hands':
+        from gesture_detector import GestureDetectorLogger
+        return GestureDetectorLogger(video_mode=True, metrics=metrics, **options)
+    if backend == 'recognizer':
+        return RecognizerBackend(metrics=metrics, **options)
+    raise ValueError(f"Unknown recognition backend: {backend}")
+
+
+# Function to get the options of a backend for the offline tools, which need the result of every frame,
+# so the GestureRecognizer task runs in the video mode.
+def video_backend_options(options):
+    options = dict(options or {})
+    if options.get('backend') == 'recognizer':
+        options['running_mode'] = 'video'
+    return options
+
+
+# Function to add the options selecting the backend to a command line parser.
+def add_backend_arguments(parser):
+    parser.add_argument('--backend', choices=BACKENDS, help=f"Gesture recognition backend (default: {DEFAULT_BACKEND}).")
+    parser.add_argument('--backend-config', help="JSON file with the backend and its options, such as "
+                                                 '{"backend": "recognizer", "model_path": "...", "label_map": {...}}.')
+    parser.add_argument('--recognizer-model', help=f"Model of the recognizer backend (default: {RECOGNIZER_MODEL_PATH}).")
+    parser.add_argument('--running-mode', choices=RUNNING_MODES, help="Running mode of the recognizer backend.")
+    parser.add_argument('--label-map', help="JSON file mapping the gestures of the recognizer to the gallery's gestures.")
+
+
+# Function to get the backend options given on the command line, as keyword arguments of create_backend().
+# The options of the configuration file are overridden by the ones given on the command line. With the hands
+# backend, the options of the recognizer backend are ignored with a warning.
+def backend_options(args):
+    options = {}
+    if args.backend_config:
+        with open(args.backend_config, 'r', encoding='utf-8') as f:
+            options = json.load(f)
+    if args.backend:
+        options['backend'] = args.backend
+    if options.get('backend', DEFAULT_BACKEND) != 'recognizer':
+        ignored = [name for name in RECOGNIZER_OPTIONS if options.pop(name, None) is not None]
+        ignored += [flag for flag, value in (('--recognizer-model', args.recognizer_model),
+                                             ('--running-mode', args.running_mode),
+                                             ('--label-map', args.label_map)) if value]
+        if ignored:
+            print(f"Warning: Ignoring the options of the recognizer backend with the hands backend: "
+                  f"{', '.join(ignored)}.")
+        return options
+    if args.recognizer_model:
+        options['model_path'] = args.recognizer_model
+    if args.running_mode:
+        options['running_mode'] = args.running_mode
+    if args.label_map:
+        options['label_map'] = LabelMap.load(args.label_map)
+    elif isinstance(options.get('label_map'), dict):
+        options['label_map'] = LabelMap(options['label_map'])
+    return options
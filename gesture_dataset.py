@@ -0,0 +1,281 @@
+# We import the modules needed to store the collected hand landmarks in a compact, appendable format.
+import argparse
+import json
+import os
+import pickle
+import time
+import numpy as np
+
+# The directory of the dataset, and the pickle file written by the previous versions of collect_data.py.
+DATASET_DIR = 'gesture_dataset'
+LEGACY_DATA_PATH = 'gesture_data.pkl'
+INDEX_FILE = 'index.json'
+
+# The gestures collected by collect_data.py.
+GESTURES = ['Next', 'Previous', 'OK', 'Victory', 'Like', 'Dislike', 'Open Palm', 'Closed Palm']
+
+# The number of landmarks of a hand, each with x, y and z coordinates.
+NUM_HAND_LANDMARKS = 21
+
+# The default number of samples per chunk file.
+CHUNK_SIZE = 1024
+
+# The columns of the dataset, with their type, the shape of their values and the value of a missing value:
+#   landmarks: the coordinates of the landmarks of the hand,
+#   labels: the id of the gesture, the position of its name in the labels of the index,
+#   sessions: the id of the collection session, the position of its metadata in the sessions of the index,
+#   handedness: the position of the hand in HANDEDNESS, as reported by mediapipe,
+#   timestamps: the time the frame was captured, in seconds since the epoch.
+COLUMNS = {
+    'landmarks': (np.float32, (NUM_HAND_LANDMARKS, 3), np.nan),
+    'labels': (np.uint8, (), 0),
+    'sessions': (np.int16, (), -1),
+    'handedness': (np.int8, (), -1),
+    'timestamps': (np.float64, (), np.nan),
+}
+HANDEDNESS = ['Left', 'Right']
+NO_SESSION = -1
+
+
+# Function to get the path of a column of a chunk of the dataset.
+def chunk_path(path, chunk_name, column):
+    return os.path.join(path, f'{chunk_name}.{column}.npy')
+
+
+# Function to read the index of a dataset: its labels, its collection sessions, the list of its chunks with
+# their number of samples, and the number used to name the next chunk.
+def read_index(path):
+    index_path = os.path.join(path, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return {'labels': [], 'sessions': [], 'chunks': [], 'next_chunk': 0}
+    with open(index_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# Function to write the index of a dataset. It is replaced atomically, so a chunk only becomes part of the
+# dataset once its files are completely written.
+def write_index(path, index):
+    temporary_path = os.path.join(path, INDEX_FILE + '.tmp')
+    with open(temporary_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=1)
+    os.replace(temporary_path, os.path.join(path, INDEX_FILE))
+
+
+# Function to name a new chunk of a dataset. The names are never reused, so a chunk file that is not yet
+# (or no longer) in the index is never overwritten.
+def new_chunk_name(index):
+    number = index.get('next_chunk', len(index['chunks']))
+    index['next_chunk'] = number + 1
+    return f'chunk-{number:05d}'
+
+
+# We define the writer that appends samples to a dataset. The samples are stored in preallocated buffers, one
+# per column, and written as a new chunk (one .npy file per column) every chunk_size samples, so the memory use
+# stays constant and at most one chunk is lost if the collection is interrupted.
+class GestureDatasetWriter:
+    def __init__(self, path=DATASET_DIR, labels=GESTURES, chunk_size: int = CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        os.makedirs(path, exist_ok=True)
+        self.index = read_index(path)
+        self.index.setdefault('sessions', [])
+        # The ids of the labels are their positions in the index, and new labels are added at the end.
+        for label in labels:
+            if label not in self.index['labels']:
+                self.index['labels'].append(label)
+        self._label_ids = {label: i for i, label in enumerate(self.index['labels'])}
+        self._buffers = {column: np.empty((chunk_size, *shape), dtype=dtype)
+                         for column, (dtype, shape, _) in COLUMNS.items()}
+        self._count = 0
+        self.session = NO_SESSION  # The id of the session of the samples being appended.
+        self.samples_written = sum(chunk['count'] for chunk in self.index['chunks'])
+
+    # Function to start a collection session, or to resume the session with the same name, and return its id.
+    # The session is recorded in the index with its metadata, such as the name of the collector.
+    def start_session(self, name, **metadata):
+        for session_id, session in enumerate(self.index['sessions']):
+            if session['name'] == name:
+                break
+        else:
+            session_id = len(self.index['sessions'])
+            self.index['sessions'].append(dict(metadata, name=name, started=time.time()))
+            write_index(self.path, self.index)
+        self.flush()
+        self.session = session_id
+        return session_id
+
+    # Function to add a sample: the label of the gesture, the (21, 3) coordinates of the landmarks of a hand,
+    # the handedness of the hand ('Left' or 'Right') and the time the frame was captured.
+    def append(self, label, landmarks, handedness=None, timestamp=None):
+        i = self._count
+        self._buffers['landmarks'][i] = landmarks
+        self._buffers['labels'][i] = self._label_id(label)
+        self._buffers['sessions'][i] = self.session
+        self._buffers['handedness'][i] = HANDEDNESS.index(handedness) if handedness in HANDEDNESS else -1
+        self._buffers['timestamps'][i] = time.time() if timestamp is None else timestamp
+        self._count += 1
+        if self._count == self.chunk_size:
+            self.flush()
+
+    # Function to add many samples at once, with an array of labels and a (n, 21, 3) array of landmarks.
+    def extend(self, labels, landmarks):
+        landmarks = np.asarray(landmarks, dtype=np.float32).reshape(-1, NUM_HAND_LANDMARKS, 3)
+        for start in range(0, len(landmarks), self.chunk_size):
+            self.flush()
+            end = min(start + self.chunk_size, len(landmarks))
+            for column, (_, _, default) in COLUMNS.items():
+                self._buffers[column][:end - start] = default
+            self._buffers['landmarks'][:end - start] = landmarks[start:end]
+            self._buffers['labels'][:end - start] = [self._label_id(label) for label in labels[start:end]]
+            self._buffers['sessions'][:end - start] = self.session
+            self._count = end - start
+        self.flush()
+
+    def _label_id(self, label):
+        if label not in self._label_ids:
+            self._label_ids[label] = len(self.index['labels'])
+            self.index['labels'].append(label)
+        return self._label_ids[label]
+
+    # Function to write the buffered samples as a new chunk.
+    def flush(self):
+        if self._count == 0:
+            return
+        chunk_name = new_chunk_name(self.index)
+        for column, buffer in self._buffers.items():
+            np.save(chunk_path(self.path, chunk_name, column), buffer[:self._count])
+        self.index['chunks'].append({'name': chunk_name, 'count': self._count})
+        write_index(self.path, self.index)
+        self.samples_written += self._count
+        self._count = 0
+
+    # Function to write the remaining samples.
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# We define the reader of a dataset. The chunks are memory-mapped, so loading a dataset does not read it into
+# memory, and a dataset made of a single chunk (see compact()) is used for training without any copy.
+# The columns missing from the chunks written by earlier versions are filled with their default values.
+class GestureDataset:
+    def __init__(self, path=DATASET_DIR):
+        self.path = path
+        self.index = read_index(path)
+        self.labels = np.array(self.index['labels'])
+        self.sessions = self.index.get('sessions', [])
+        self.chunks = [self._load_chunk(chunk) for chunk in self.index['chunks']]
+
+    def _load_chunk(self, chunk):
+        columns = {}
+        for column, (dtype, shape, default) in COLUMNS.items():
+            column_path = chunk_path(self.path, chunk['name'], column)
+            if os.path.exists(column_path):
+                columns[column] = np.load(column_path, mmap_mode='r')
+            else:
+                columns[column] = np.full((chunk['count'], *shape), default, dtype=dtype)
+        return columns
+
+    def __len__(self):
+        return sum(chunk['count'] for chunk in self.index['chunks'])
+
+    # Function to get a column of all samples, without a copy if the dataset has a single chunk.
+    def column(self, column):
+        if len(self.chunks) == 1:
+            return self.chunks[0][column]
+        if not self.chunks:
+            dtype, shape, _ = COLUMNS[column]
+            return np.empty((0, *shape), dtype=dtype)
+        return np.concatenate([chunk[column] for chunk in self.chunks])
+
+    # Function to get the landmarks of all samples as a (n, 21, 3) float32 array.
+    def landmarks(self):
+        return self.column('landmarks')
+
+    # Function to get the label ids of all samples.
+    def label_ids(self):
+        return self.column('labels')
+
+    # Function to get the training data: the landmarks flattened to (n, 63) and the name of the gesture of each sample.
+    def features_and_labels(self):
+        landmarks = self.landmarks()
+        return landmarks.reshape(len(landmarks), -1), self.labels[self.label_ids()]
+
+    # Function to count the samples of each gesture, in all sessions or in the given session.
+    def counts(self, session=None):
+        label_ids = self.label_ids()
+        if session is not None:
+            label_ids = label_ids[self.column('sessions') == session]
+        counts = np.bincount(label_ids, minlength=len(self.labels))
+        return dict(zip(self.labels.tolist(), counts.tolist()))
+
+    # Function to get the id of the session with the given name, or None if there is none.
+    def session_id(self, name):
+        for session_id, session in enumerate(self.sessions):
+            if session['name'] == name:
+                return session_id
+        return None
+
+
+# Function to rewrite a dataset as a single chunk, so that it is loaded for training without any copy.
+def compact(path=DATASET_DIR):
+    dataset = GestureDataset(path)
+    if len(dataset.chunks) <= 1:
+        return
+    old_chunks = dataset.index['chunks']
+    index = dict(dataset.index, chunks=[])
+    # The merged chunk gets a new name, so the index points to complete files at any time.
+    chunk_name = new_chunk_name(index)
+    for column in COLUMNS:
+        np.save(chunk_path(path, chunk_name, column), dataset.column(column))
+    index['chunks'].append({'name': chunk_name, 'count': len(dataset)})
+    del dataset
+    write_index(path, index)
+    for chunk in old_chunks:
+        for column in COLUMNS:
+            if os.path.exists(chunk_path(path, chunk['name'], column)):
+                os.remove(chunk_path(path, chunk['name'], column))
+
+
+# Function to convert the pickled data of the previous versions of collect_data.py, a dictionary of lists of
+# landmarks by gesture, into a dataset. The samples are appended if the dataset already exists.
+def migrate_pickle(pickle_path=LEGACY_DATA_PATH, path=DATASET_DIR):
+    with open(pickle_path, 'rb') as f:
+        gesture_data = pickle.load(f)
+    with GestureDatasetWriter(path, labels=list(gesture_data)) as writer:
+        for gesture, samples in gesture_data.items():
+            if samples:
+                writer.extend([gesture] * len(samples), samples)
+    compact(path)
+    return writer.samples_written
+
+
+# Function to open the dataset for reading, after converting the pickled data if there is no dataset yet.
+def load_dataset(path=DATASET_DIR, legacy_path=LEGACY_DATA_PATH):
+    if not os.path.exists(os.path.join(path, INDEX_FILE)) and os.path.exists(legacy_path):
+        print(f"Converting {legacy_path} to the dataset in {path}.")
+        migrate_pickle(legacy_path, path)
+    return GestureDataset(path)
+
+
+# If the file is run directly, we convert, compact or describe a dataset.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the dataset of collected hand landmarks.")
+    parser.add_argument('command', choices=['migrate', 'compact', 'info'])
+    parser.add_argument('--path', default=DATASET_DIR, help="Directory of the dataset.")
+    parser.add_argument('--pickle', default=LEGACY_DATA_PATH, help="Pickle file to convert with 'migrate'.")
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        print(f"The dataset now has {migrate_pickle(args.pickle, args.path)} samples.")
+    elif args.command == 'compact':
+        compact(args.path)
+    dataset = GestureDataset(args.path)
+    print(f"{len(dataset)} samples in {len(dataset.chunks)} chunks: {dataset.counts()}")
+    for session_id, session in enumerate(dataset.sessions):
+        print(f"Session {session['name']}: {dataset.counts(session_id)}")
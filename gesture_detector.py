@@ -1,59 +1,300 @@
 # We import the necessary modules for video processing, array manipulation, gesture detection and the Machine Learning model.
+import collections
 import cv2
 import numpy as np
 import mediapipe as mp
+import operator
+import os
 import pickle
+from gesture_features import landmark_features, model_feature_set
+from gesture_metrics import PipelineMetrics
+from linear_gesture_model import LINEAR_MODEL_PATH, LinearGestureModel, file_digest
+
+# The file in which train_model.py saves the trained sklearn pipeline.
+SKLEARN_MODEL_PATH = 'gesture_model.pkl'
+
+# The number of landmarks that mediapipe detects for each hand, each with x, y and z coordinates.
+NUM_HAND_LANDMARKS = 21
+NUM_LANDMARK_FEATURES = NUM_HAND_LANDMARKS * 3
+
+# We read the x, y and z coordinates of a landmark with a single call.
+_landmark_xyz = operator.attrgetter('x', 'y', 'z')
+
+# Function to copy the landmarks of all detected hands into a (num_hands, 63) float32 array.
+# If a large enough buffer is given, it is filled in place instead of allocating a new array.
+def landmarks_to_array(multi_hand_landmarks, out=None):
+    num_hands = len(multi_hand_landmarks)
+    if out is None or out.shape[0] < num_hands:
+        out = np.empty((num_hands, NUM_LANDMARK_FEATURES), dtype=np.float32)
+    features = out[:num_hands]
+    features.reshape(num_hands, NUM_HAND_LANDMARKS, 3)[:] = [
+        list(map(_landmark_xyz, hand_landmarks.landmark)) for hand_landmarks in multi_hand_landmarks
+    ]
+    return features
+
+# Function to convert a BGR frame to RGB into a buffer that is reused from frame to frame, and reallocated only
+# when the size of the frames changes. The result is marked read-only, so mediapipe uses it without copying it.
+def bgr_to_rgb(image, out=None):
+    if out is None or out.shape != image.shape:
+        out = np.empty_like(image)
+    out.flags.writeable = True
+    cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=out)
+    out.flags.writeable = False
+    return out
+
+# Function to compute the region of interest around the detected hands, in pixels, as (x0, y0, x1, y1).
+# The bounding box of the landmarks is padded by a fraction of its longest side and clipped to the image.
+def hand_roi(multi_hand_landmarks, width: int, height: int, padding: float = 0.5, min_size: int = 96):
+    xs = [lm.x for hand_landmarks in multi_hand_landmarks for lm in hand_landmarks.landmark]
+    ys = [lm.y for hand_landmarks in multi_hand_landmarks for lm in hand_landmarks.landmark]
+    x0, x1 = min(xs) * width, max(xs) * width
+    y0, y1 = min(ys) * height, max(ys) * height
+    half_size = max(x1 - x0, y1 - y0, min_size) * (0.5 + padding)
+    center_x, center_y = (x0 + x1) / 2, (y0 + y1) / 2
+    roi = (max(int(center_x - half_size), 0), max(int(center_y - half_size), 0),
+           min(int(center_x + half_size), width), min(int(center_y + half_size), height))
+    if roi[2] - roi[0] < 2 or roi[3] - roi[1] < 2:
+        return None  # The hands are outside of the image.
+    return roi
+
+# Function to load the gesture model. We prefer the exported NumPy model, which predicts without sklearn,
+# unless it was exported from a different pickled model (the model was retrained but not exported again).
+def load_gesture_model():
+    if os.path.exists(LINEAR_MODEL_PATH):
+        model = LinearGestureModel.load(LINEAR_MODEL_PATH)
+        if not os.path.exists(SKLEARN_MODEL_PATH) or model.source_digest == file_digest(SKLEARN_MODEL_PATH):
+            return model
+    with open(SKLEARN_MODEL_PATH, 'rb') as f:
+        return pickle.load(f)
+
+# We define a smoother that votes over the most recent gestures, each vote weighted by the confidence of the
+# classifier. The votes are kept in a ring buffer with a running score per gesture, so each update takes
+# constant time. With hysteresis, the smoothed gesture only changes when another gesture leads it by more than
+# that fraction of the total score, which avoids flickering between two gestures.
+# A vote without a confidence, such as "None" for a frame without hand, weighs as much as the average vote of a
+# hand in the window (or the last one if there is none), so that it does not outweigh gestures whose
+# probabilities are always below 1.
+class GestureSmoother:
+    def __init__(self, window: int = 5, hysteresis: float = 0.0):
+        self.window = window
+        self.hysteresis = hysteresis
+        self.reset()
+
+    # Function to forget all votes.
+    def reset(self):
+        self._gestures = [None] * self.window
+        self._weights = [0.0] * self.window
+        self._has_confidence = [False] * self.window
+        self._next = 0  # The position in the ring buffer of the next vote.
+        self._count = 0  # The number of votes in the ring buffer.
+        self._scores = collections.defaultdict(float)
+        self._total = 0.0
+        # The number and the total weight of the votes with a confidence in the window, and the last confidence.
+        self._confident_count = 0
+        self._confident_total = 0.0
+        self._last_confidence = 1.0
+        self.current = "None"
+
+    # Function to add the vote of a frame and return the smoothed gesture. Without a confidence, the vote weighs
+    # as much as the average vote with a confidence.
+    def update(self, gesture: str, confidence=None) -> str:
+        # When the window is full, the oldest vote is replaced by the new one.
+        if self._count == self.window:
+            old_gesture, old_weight = self._gestures[self._next], self._weights[self._next]
+            self._scores[old_gesture] -= old_weight
+            self._total -= old_weight
+            if self._scores[old_gesture] <= 1e-9:
+                del self._scores[old_gesture]
+            if self._has_confidence[self._next]:
+                self._confident_count -= 1
+                self._confident_total = self._confident_total - old_weight if self._confident_count else 0.0
+        else:
+            self._count += 1
+        if confidence is None:
+            confidence = self._confident_total / self._confident_count if self._confident_count > 0 \
+                else self._last_confidence
+            self._has_confidence[self._next] = False
+        else:
+            self._has_confidence[self._next] = True
+            self._confident_count += 1
+            self._confident_total += confidence
+            self._last_confidence = confidence
+        self._gestures[self._next], self._weights[self._next] = gesture, confidence
+        self._next = (self._next + 1) % self.window
+        self._scores[gesture] += confidence
+        self._total += confidence
+
+        # There are at most as many scores as gestures, so finding the leader takes constant time.
+        leader = max(self._scores, key=self._scores.__getitem__)
+        margin = self._scores[leader] - self._scores.get(self.current, 0.0)
+        if leader != self.current and margin > self.hysteresis * self._total:
+            self.current = leader
+        return self.current
 
 # We define the GestureDetectorLogger class for gesture detection and logging.
 class GestureDetectorLogger:
-    def __init__(self, video_mode: bool = False):
+    def __init__(self, video_mode: bool = False, smoothing_window: int = 5, hysteresis: float = 0.0,
+                 confidence_weighting: bool = True, tracking_mode: bool = False, roi_padding: float = 0.5,
+                 roi_max_size: int = 256, roi_refresh_interval: int = 30, metrics=None, motion_gate=None):
         # We initialize the video mode.
         self._video_mode = video_mode
 
         # We load the trained gesture model from the file.
-        with open('gesture_model.pkl', 'rb') as f:
-            self.model = pickle.load(f)
+        self.model = load_gesture_model()
+        self.feature_set = model_feature_set(self.model)  # The features the model was trained on.
 
-        # We initialize the history of gestures and their labels.
-        self.gesture_history = []
+        # We initialize the smoothing of the gestures over the recent frames, and their labels.
+        # The votes are weighted by the probability of the gesture when the model provides probabilities.
+        self.smoother = GestureSmoother(smoothing_window, hysteresis)
+        self.confidence_weighting = confidence_weighting and hasattr(self.model, 'predict_proba')
         self.gesture_labels = ['Next', 'Previous', 'OK', 'Victory', 'Like', 'Dislike', 'Open Palm', 'Closed Palm']
+        self.labels = [str(label) for label in self.model.classes_]  # The gestures the model predicts.
 
         # We initialize the mediapipe for hand detection.
         self.mp_hands = mp.solutions.hands
         self.hands = self.mp_hands.Hands()
         self.mp_drawing = mp.solutions.drawing_utils
 
+        # In tracking mode, the hands are looked for only in a region around the hands of the previous frame,
+        # downscaled so that its longest side is at most roi_max_size pixels. The whole frame is processed
+        # when no hand is tracked, when the hands are lost, and every roi_refresh_interval frames to find new hands.
+        # The region gets its own mediapipe instance, because its internal tracking works in the region's coordinates.
+        self.tracking_mode = tracking_mode
+        self.roi_padding = roi_padding
+        self.roi_max_size = roi_max_size
+        self.roi_refresh_interval = roi_refresh_interval
+        self.roi = None
+        self._frames_since_full_frame = 0
+        if tracking_mode:
+            self.roi_hands = self.mp_hands.Hands()
+
+        # We preallocate the feature buffer for the maximum number of hands mediapipe looks for.
+        self._features = np.empty((2, NUM_LANDMARK_FEATURES), dtype=np.float32)
+        self._image_rgb = None  # The RGB conversion of the frame, reused for every frame.
+        self.last_hand_count = 0  # The number of hands detected in the last frame.
+        # Whether the hands were looked for in the last frame, rather than it being skipped by the motion gate.
+        self.last_frame_processed = True
+
+        # With a MotionGate of motion_gate.py, the hands are only looked for in the frames in which something moved,
+        # while no hand is tracked. The other frames count as frames without hand.
+        self.motion_gate = motion_gate
+
+        # We time the stages of every frame and count the frames, hands and predictions. Without given metrics,
+        # they are disabled and can be enabled at any time with self.metrics.enabled = True.
+        self.metrics = metrics if metrics is not None else PipelineMetrics(enabled=False)
+
     # Feature for detecting and logging gestures in an image.
     def detect_and_log(self, image, frame_idx: int) -> str:
         # We get the dimensions of the image and convert it to RGB.
+        metrics = self.metrics
+        frame_start = t = metrics.start()
+        if self.motion_gate is not None:
+            process = self.motion_gate.should_process(image, self.last_hand_count > 0)
+            t = metrics.lap('motion_gate', t)
+            self.last_frame_processed = process
+            if not process:
+                metrics.increment('skipped_frames')
+                final_gesture = self.smoother.update("None")
+                metrics.end_frame(frame_start)
+                return final_gesture
+            metrics.increment('processed_frames')
         height, width, _ = image.shape
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        results = self.hands.process(image_rgb)
+        image_rgb = self._image_rgb = bgr_to_rgb(image, self._image_rgb)
+        t = metrics.lap('color_conversion', t)
+        results = None
+        if self.tracking_mode and self.roi is not None and self._frames_since_full_frame < self.roi_refresh_interval:
+            results = self.process_roi(image_rgb)
+        if results is None:
+            results = self.hands.process(image_rgb)
+            self._frames_since_full_frame = 0
+        else:
+            self._frames_since_full_frame += 1
+        if self.tracking_mode:
+            self.roi = hand_roi(results.multi_hand_landmarks, width, height, self.roi_padding) \
+                if results.multi_hand_landmarks else None
+        t = metrics.lap('hands_process', t)
 
         gesture_category = "None"
+        confidence = None  # A frame without hand weighs as much as the recent hands, see GestureSmoother.
+        self.last_hand_count = len(results.multi_hand_landmarks) if results.multi_hand_landmarks else 0
         # If hands were detected, we extract the coordinates of the landmarks and predict the gesture.
         if results.multi_hand_landmarks:
+            # We copy the landmarks of every hand into the feature buffer and classify all hands in one call.
+            if len(results.multi_hand_landmarks) > len(self._features):
+                self._features = np.empty((len(results.multi_hand_landmarks), NUM_LANDMARK_FEATURES), dtype=np.float32)
+            features = landmarks_to_array(results.multi_hand_landmarks, self._features)
+            t = metrics.lap('landmark_extraction', t)
+            # As before, the gesture of the last detected hand is the one that is logged.
+            gesture_category, confidence = self.classify(features)
+            t = metrics.lap('predict', t)
             for hand_landmarks in results.multi_hand_landmarks:
-                landmarks = []
-                for lm in hand_landmarks.landmark:
-                    landmarks.append([lm.x, lm.y, lm.z])
-                # We flatten the landmark array and predict the gesture using the loaded model.
-                landmarks = np.array(landmarks).flatten().reshape(1, -1)
-                gesture_category = self.model.predict(landmarks)[0]
                 # We draw the landmarks of the hand on the image using mediapipe.
                 self.mp_drawing.draw_landmarks(image, hand_landmarks, self.mp_hands.HAND_CONNECTIONS)
+            t = metrics.lap('draw', t)
+            metrics.increment('hands', self.last_hand_count)
+            metrics.increment('predictions', len(features))
 
-        # We add the detected gesture to the gesture history and keep its size to a maximum of 5.
-        self.gesture_history.append(gesture_category)
-        if len(self.gesture_history) > 5:
-            self.gesture_history.pop(0)
-
-        # We determine the most frequent gesture and return it.
-        final_gesture = self.get_most_common_gesture()
+        # We add the detected gesture to the smoother and return the gesture with the highest weighted score.
+        final_gesture = self.smoother.update(gesture_category, confidence)
+        metrics.lap('smoothing', t)
+        metrics.end_frame(frame_start)
         return final_gesture
 
-    # Function to determine the most frequent gesture from the gesture history.
+    # Function to look for the hands in the region of interest only. The landmarks are converted to the
+    # coordinates of the whole image, as expected by the model. It returns None if no hand is found in the region.
+    def process_roi(self, image_rgb):
+        height, width, _ = image_rgb.shape
+        x0, y0, x1, y1 = self.roi
+        roi_width, roi_height = x1 - x0, y1 - y0
+        crop = image_rgb[y0:y1, x0:x1]
+        scale = self.roi_max_size / max(roi_width, roi_height)
+        if scale < 1:
+            crop = cv2.resize(crop, (max(int(roi_width * scale), 1), max(int(roi_height * scale), 1)),
+                              interpolation=cv2.INTER_AREA)
+        else:
+            crop = np.ascontiguousarray(crop)
+
+        results = self.roi_hands.process(crop)
+        if not results.multi_hand_landmarks:
+            return None
+        for hand_landmarks in results.multi_hand_landmarks:
+            for lm in hand_landmarks.landmark:
+                lm.x = (x0 + lm.x * roi_width) / width
+                lm.y = (y0 + lm.y * roi_height) / height
+                # The depth has the same scale as x, which is relative to the width of the image.
+                lm.z = lm.z * roi_width / width
+        return results
+
+    # Function to detect the hands of an RGB image and return their (n, 21, 3) landmarks. The gestures are not
+    # classified here, so that the offline tools classify the hands of many frames at once with classify_hands();
+    # None is returned for them, as expected by the backends of gesture_backends.py.
+    def detect_hands(self, image_rgb, timestamp_ms=None):
+        results = self.hands.process(image_rgb)
+        if not results.multi_hand_landmarks:
+            return np.empty((0, NUM_HAND_LANDMARKS, 3), dtype=np.float32), None, None
+        return landmarks_to_array(results.multi_hand_landmarks).reshape(-1, NUM_HAND_LANDMARKS, 3), None, None
+
+    # Function to classify any number of hands, given as (n, 63) landmark arrays, and return the gesture of each,
+    # with its confidence. The landmarks are converted to the features the model was trained on.
+    def classify_hands(self, features):
+        features = landmark_features(features, self.feature_set)
+        if self.confidence_weighting:
+            probabilities = self.model.predict_proba(features)
+            best = probabilities.argmax(axis=1)
+            return self.model.classes_[best], probabilities[np.arange(len(best)), best]
+        return self.model.predict(features), np.ones(len(features))
+
+    # Function to classify the hands and return the gesture of the last one, with its confidence.
+    def classify(self, features):
+        gestures, confidences = self.classify_hands(features)
+        return gestures[-1], float(confidences[-1])
+
+    # Function to determine the most frequent gesture from the recent gestures.
     def get_most_common_gesture(self):
-        if not self.gesture_history:
-            return "None"
-        return max(set(self.gesture_history), key=self.gesture_history.count)
+        return self.smoother.current
+
+    # Function to release the mediapipe instances.
+    def close(self):
+        self.hands.close()
+        if self.tracking_mode:
+            self.roi_hands.close()
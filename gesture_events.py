@@ -0,0 +1,69 @@
+# We import the modules needed to turn the stream of recognized gestures into discrete gesture events.
+import collections
+import time
+
+# The kinds of gesture events: a gesture starts, is still held, or ends.
+ONSET = 'onset'
+HOLD = 'hold'
+RELEASE = 'release'
+
+# A gesture event, with the time it happened and how long the gesture had been held at that time.
+GestureEvent = collections.namedtuple('GestureEvent', ['kind', 'gesture', 'timestamp', 'held_for'])
+
+
+# We define the state machine that emits edge-triggered events from the smoothed gesture of every frame.
+# A gesture fires an onset event once when it appears; holding it does not fire it again. It is re-armed
+# when the hand leaves the frame (the gesture "None"), and two onsets of the same gesture are at least
+# its cooldown apart, so a hand that briefly drops out of detection does not fire twice: a gesture shown again
+# within its cooldown does not fire, even once the cooldown is over, until the hand leaves the frame again.
+class GestureEventMachine:
+    def __init__(self, default_cooldown: float = 0.5, cooldowns=None, hold_interval: float = 1.0,
+                 no_gesture: str = "None"):
+        self.default_cooldown = default_cooldown  # Minimum time in seconds between two onsets of a gesture.
+        self.cooldowns = dict(cooldowns or {})  # Cooldowns of specific gestures, in seconds.
+        self.hold_interval = hold_interval  # Time in seconds between hold events while a gesture is held.
+        self.no_gesture = no_gesture
+        self.active = no_gesture  # The gesture currently shown by the hand.
+        self.active_since = 0.0
+        self.active_fired = False  # Whether the active gesture fired an onset event.
+        self._next_hold = 0.0
+        self._last_onset = {}  # Time of the last onset of each gesture.
+        self._disarmed = set()  # Gestures that already fired since the hand last left the frame.
+
+    # Function to get the cooldown of a gesture.
+    def cooldown(self, gesture):
+        return self.cooldowns.get(gesture, self.default_cooldown)
+
+    # Function to feed the gesture recognized in a frame and return the events it produces.
+    def update(self, gesture, timestamp=None):
+        if timestamp is None:
+            timestamp = time.monotonic()
+        events = []
+
+        if gesture != self.active:
+            if self.active != self.no_gesture and self.active_fired:
+                events.append(GestureEvent(RELEASE, self.active, timestamp, timestamp - self.active_since))
+            self.active = gesture
+            self.active_since = timestamp
+            self.active_fired = False
+
+            if gesture == self.no_gesture:
+                # The hand left the frame, so every gesture can fire again.
+                self._disarmed.clear()
+
+        if gesture != self.no_gesture and not self.active_fired and gesture not in self._disarmed:
+            if timestamp - self._last_onset.get(gesture, float('-inf')) >= self.cooldown(gesture):
+                events.append(GestureEvent(ONSET, gesture, timestamp, timestamp - self.active_since))
+                self.active_fired = True
+                self._last_onset[gesture] = timestamp
+                self._disarmed.add(gesture)
+                self._next_hold = timestamp + self.hold_interval
+            else:
+                # The gesture is still cooling down, so this activation is the same gesture held through a
+                # dropout of the detection; it is used up without firing.
+                self._disarmed.add(gesture)
+        elif self.active_fired and timestamp >= self._next_hold:
+            events.append(GestureEvent(HOLD, gesture, timestamp, timestamp - self.active_since))
+            self._next_hold += self.hold_interval
+
+        return events
@@ -0,0 +1,81 @@
+# We import NumPy, which computes the features of all hands at once.
+import numpy as np
+
+# The feature sets a gesture model can be trained on:
+#   raw: the 21 x 3 landmark coordinates as given by mediapipe, relative to the image,
+#   normalized: the coordinates relative to the wrist and divided by the size of the palm, so that they do not
+#       depend on where the hand is and how far it is from the camera, with the cosines of the angles of the
+#       finger joints and the distances between the fingertips, and from the fingertips to the wrist.
+FEATURE_SETS = ('raw', 'normalized')
+DEFAULT_FEATURE_SET = 'raw'
+
+NUM_HAND_LANDMARKS = 21
+WRIST = 0
+MIDDLE_FINGER_MCP = 9
+FINGERTIPS = np.array([4, 8, 12, 16, 20])
+
+# The joints of each finger, from the palm to the fingertip, as (previous, joint, next) landmarks.
+_FINGER_CHAINS = [[0, 1, 2, 3, 4], [0, 5, 6, 7, 8], [0, 9, 10, 11, 12], [0, 13, 14, 15, 16], [0, 17, 18, 19, 20]]
+_JOINTS = np.array([chain[i:i + 3] for chain in _FINGER_CHAINS for i in range(3)])
+_FINGERTIP_PAIRS = np.triu_indices(len(FINGERTIPS), 1)
+
+# All the vectors the normalized features need are differences between two landmarks, computed with a single
+# matrix product: the vectors from the wrist to the other landmarks, the bones before and after each joint, and
+# the vectors between the fingertips. The vector from the wrist to the base of the middle finger is the palm.
+_VECTOR_ENDS = np.concatenate([np.arange(1, NUM_HAND_LANDMARKS), _JOINTS[:, 0], _JOINTS[:, 2],
+                               FINGERTIPS[_FINGERTIP_PAIRS[0]]])
+_VECTOR_STARTS = np.concatenate([np.full(NUM_HAND_LANDMARKS - 1, WRIST), _JOINTS[:, 1], _JOINTS[:, 1],
+                                 FINGERTIPS[_FINGERTIP_PAIRS[1]]])
+_DIFFERENCES = np.zeros((len(_VECTOR_ENDS), NUM_HAND_LANDMARKS), dtype=np.float32)
+_DIFFERENCES[np.arange(len(_VECTOR_ENDS)), _VECTOR_ENDS] += 1
+_DIFFERENCES[np.arange(len(_VECTOR_ENDS)), _VECTOR_STARTS] -= 1
+_NUM_JOINTS = len(_JOINTS)
+_PALM = MIDDLE_FINGER_MCP - 1
+_BEFORE = slice(NUM_HAND_LANDMARKS - 1, NUM_HAND_LANDMARKS - 1 + _NUM_JOINTS)
+_AFTER = slice(_BEFORE.stop, _BEFORE.stop + _NUM_JOINTS)
+# The vectors whose lengths are features: between the fingertips, and from the wrist to the fingertips.
+_DISTANCES = np.concatenate([np.arange(_AFTER.stop, len(_VECTOR_ENDS)), FINGERTIPS - 1])
+
+
+# Function to get the number of features of a feature set.
+def feature_count(feature_set: str = DEFAULT_FEATURE_SET):
+    if feature_set == 'raw':
+        return NUM_HAND_LANDMARKS * 3
+    if feature_set == 'normalized':
+        return (NUM_HAND_LANDMARKS - 1) * 3 + len(_JOINTS) + len(_FINGERTIP_PAIRS[0]) + len(FINGERTIPS)
+    raise ValueError(f"Unknown feature set: {feature_set}")
+
+
+# Function to compute the features of a feature set from the landmarks of any number of hands, given as a
+# (n, 21, 3) or (n, 63) array. It returns a (n, feature_count(feature_set)) float32 array.
+def landmark_features(landmarks, feature_set: str = DEFAULT_FEATURE_SET):
+    landmarks = np.asarray(landmarks, dtype=np.float32)
+    n = len(landmarks)
+    if feature_set == 'raw':
+        return landmarks.reshape(n, NUM_HAND_LANDMARKS * 3)
+    if feature_set != 'normalized':
+        raise ValueError(f"Unknown feature set: {feature_set}")
+
+    # The features are computed with a few operations on all hands at once, since a single hand is classified
+    # on every frame and each NumPy call has a fixed cost.
+    vectors = _DIFFERENCES @ landmarks.reshape(n, NUM_HAND_LANDMARKS, 3)
+    lengths = np.sqrt((vectors * vectors).sum(axis=2))
+    # We scale the hand so that the palm, from the wrist to the base of the middle finger, has a length of 1.
+    inverse_palm_size = 1.0 / np.maximum(lengths[:, _PALM:_PALM + 1], 1e-6)
+
+    # The cosine of the angle of each joint, between the bones before and after it.
+    joint_cosines = (vectors[:, _BEFORE] * vectors[:, _AFTER]).sum(axis=2) / np.maximum(
+        lengths[:, _BEFORE] * lengths[:, _AFTER], 1e-6)
+
+    # The coordinates relative to the wrist, and the distances between the fingertips and from the fingertips
+    # to the wrist, in palm sizes.
+    coordinates = vectors[:, :NUM_HAND_LANDMARKS - 1].reshape(n, (NUM_HAND_LANDMARKS - 1) * 3) * inverse_palm_size
+    distances = lengths[:, _DISTANCES] * inverse_palm_size
+
+    return np.concatenate([coordinates, joint_cosines, distances], axis=1)
+
+
+# Function to get the feature set a model was trained on. Models trained before feature sets existed use raw
+# landmarks.
+def model_feature_set(model):
+    return getattr(model, 'feature_set_', DEFAULT_FEATURE_SET)
@@ -0,0 +1,221 @@
+# We import the modules needed to time the stages of the gesture pipeline and to export the measurements.
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+# The counters of the gesture pipeline. The processed and skipped frames are those let through and skipped by the
+# motion gate.
+COUNTERS = ('frames', 'hands', 'predictions', 'dropped_frames', 'processed_frames', 'skipped_frames')
+
+# The quantiles of the stage latencies that are exported.
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+# We define a histogram of the most recent values, kept in a ring buffer, with the count and the sum of all values.
+class RollingHistogram:
+    def __init__(self, window: int = 300):
+        self._values = np.zeros(window)
+        self._next = 0
+        self.count = 0
+        self.sum = 0.0
+
+    # Function to add a value.
+    def observe(self, value: float):
+        self._values[self._next] = value
+        self._next = (self._next + 1) % len(self._values)
+        self.count += 1
+        self.sum += value
+
+    # Function to get the most recent values, at most window of them.
+    def recent(self):
+        return self._values[:min(self.count, len(self._values))].copy()
+
+    # Function to get the quantiles of the most recent values.
+    def quantiles(self, quantiles=QUANTILES):
+        values = self.recent()
+        if not len(values):
+            return [float('nan')] * len(quantiles)
+        return np.quantile(values, quantiles).tolist()
+
+
+# We define the measurements of the gesture pipeline: the latency of each stage of every frame, the frame rate
+# and the counters. It can be enabled and disabled at any time. While disabled, start() returns None and the
+# other calls return immediately, so the instrumented code only pays for a few attribute lookups.
+#
+# A frame is timed with:
+#     t = metrics.start()
+#     ...  # first stage
+#     t = metrics.lap('first_stage', t)
+#     ...
+#     metrics.end_frame(frame_start)
+class PipelineMetrics:
+    def __init__(self, enabled: bool = True, window: int = 300):
+        self.enabled = enabled
+        self.window = window  # The number of recent frames used for the quantiles and the frame rate.
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.stages = {}
+        self._frame_times = RollingHistogram(window)  # The end time of the recent frames.
+        self._lock = threading.Lock()
+
+    # Function to get the start time of a frame or a stage, or None if the metrics are disabled.
+    def start(self):
+        return time.perf_counter() if self.enabled else None
+
+    # Function to record the latency of a stage that started at the given time, and return the current time
+    # as the start of the next stage.
+    def lap(self, stage: str, start):
+        if start is None:
+            return None
+        now = time.perf_counter()
+        with self._lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = RollingHistogram(self.window)
+            histogram.observe(now - start)
+        return now
+
+    # Function to record the end of a frame that started at the given time.
+    def end_frame(self, start):
+        if start is None:
+            return
+        now = self.lap('frame', start)
+        with self._lock:
+            self.counters['frames'] += 1
+            self._frame_times.observe(now)
+
+    # Function to add an amount to a counter.
+    def increment(self, counter: str, amount: int = 1):
+        if self.enabled:
+            with self._lock:
+                self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    # Function to set a counter that is maintained elsewhere, such as the frames dropped by the frame queue.
+    def set_counter(self, counter: str, value: int):
+        if self.enabled:
+            with self._lock:
+                self.counters[counter] = value
+
+    # Function to get the frame rate over the recent frames, in frames per second.
+    def frame_rate(self):
+        with self._lock:
+            times = self._frame_times.recent()
+        if len(times) < 2 or times.max() <= times.min():
+            return 0.0
+        return float((len(times) - 1) / (times.max() - times.min()))
+
+    # Function to forget all measurements.
+    def reset(self):
+        with self._lock:
+            self.counters = dict.fromkeys(COUNTERS, 0)
+            self.stages = {}
+            self._frame_times = RollingHistogram(self.window)
+
+    # Function to get a summary of the measurements: the counters, the frame rate and, for each stage,
+    # the quantiles of its latency in milliseconds.
+    def summary(self):
+        with self._lock:
+            stages = {stage: histogram.quantiles() for stage, histogram in self.stages.items()}
+            counters = dict(self.counters)
+        return {
+            'counters': counters,
+            'frame_rate': self.frame_rate(),
+            'stages_ms': {stage: {f'p{int(q * 100)}': value * 1000 for q, value in zip(QUANTILES, quantiles)}
+                          for stage, quantiles in stages.items()},
+        }
+
+    # Function to render the measurements in the Prometheus text exposition format.
+    def render(self, prefix: str = 'gesture'):
+        with self._lock:
+            stages = [(stage, histogram.quantiles(), histogram.sum, histogram.count)
+                      for stage, histogram in sorted(self.stages.items())]
+            counters = sorted(self.counters.items())
+        lines = [f'# HELP {prefix}_stage_seconds Latency of each stage of the gesture pipeline over the recent frames.',
+                 f'# TYPE {prefix}_stage_seconds summary']
+        for stage, quantiles, total, count in stages:
+            for q, value in zip(QUANTILES, quantiles):
+                lines.append(f'{prefix}_stage_seconds{{stage="{stage}",quantile="{q}"}} {value:.6g}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {total:.6g}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {count}')
+        for counter, value in counters:
+            lines.append(f'# TYPE {prefix}_{counter}_total counter')
+            lines.append(f'{prefix}_{counter}_total {value}')
+        lines.append(f'# HELP {prefix}_frame_rate Frames processed per second over the recent frames.')
+        lines.append(f'# TYPE {prefix}_frame_rate gauge')
+        lines.append(f'{prefix}_frame_rate {self.frame_rate():.3f}')
+        lines.append(f'# TYPE {prefix}_metrics_enabled gauge')
+        lines.append(f'{prefix}_metrics_enabled {int(self.enabled)}')
+        return '\n'.join(lines) + '\n'
+
+
+# Function to write the measurements to a file in the Prometheus text format. The file is replaced atomically,
+# so it can be read by a collector at any time (e.g. the textfile collector of the node exporter).
+def write_metrics_file(metrics: PipelineMetrics, path):
+    temporary_path = f'{path}.tmp'
+    with open(temporary_path, 'w', encoding='utf-8') as f:
+        f.write(metrics.render())
+    os.replace(temporary_path, path)
+
+
+# We define the exporter of the measurements. It writes them to a file every interval seconds and/or serves
+# them over HTTP at /metrics, both from background threads.
+class MetricsExporter:
+    def __init__(self, metrics: PipelineMetrics, path=None, address=None, interval: float = 5.0):
+        self.metrics = metrics
+        self.path = path
+        self.address = address  # The (host, port) on which the measurements are served.
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._server = None
+
+    # Function to start writing and/or serving the measurements.
+    def start(self):
+        if self.path is not None:
+            self._thread = threading.Thread(target=self._write_loop, name="metrics-writer", daemon=True)
+            self._thread.start()
+        if self.address is not None:
+            metrics = self.metrics
+
+            class MetricsHandler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split('?')[0] not in ('/', '/metrics'):
+                        self.send_error(404)
+                        return
+                    body = metrics.render().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                # The requests are not logged, since a scraper makes one every few seconds.
+                def log_message(self, format, *args):
+                    pass
+
+            self._server = ThreadingHTTPServer(self.address, MetricsHandler)
+            threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True).start()
+
+    def _write_loop(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                write_metrics_file(self.metrics, self.path)
+            except OSError as e:
+                print(f"Error: Could not write the metrics to {self.path}: {e}")
+
+    # Function to stop the exporter. The file is written one last time.
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            write_metrics_file(self.metrics, self.path)
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+# Function to parse an address given as host:port, or as a port only.
+def parse_metrics_address(text):
+    host, _, port = text.rpartition(':')
+    return host or 'localhost', int(port)
@@ -0,0 +1,177 @@
+# We import the modules needed to run webcam capture and gesture inference off the Tkinter main thread.
+import collections
+import queue
+import threading
+import time
+
+
+# We define a pool of frame buffers, into which the webcam frames are read instead of allocating a new frame for
+# every read. A buffer is taken with acquire() and given back with release() once the frame is no longer used.
+# When the resolution changes, the buffers of the previous resolution are discarded.
+class FramePool:
+    def __init__(self, size: int = 4):
+        self.size = size  # The maximum number of free buffers kept.
+        self.shape = None  # The shape of the frames, known after the first frame is released.
+        self._free = []
+        self._lock = threading.Lock()
+
+    # Function to take a free buffer, or None if there is none, in which case the read allocates the frame.
+    def acquire(self):
+        with self._lock:
+            return self._free.pop() if self._free else None
+
+    # Function to give back the buffer of a frame that is no longer used.
+    def release(self, frame):
+        with self._lock:
+            if frame.shape != self.shape:
+                self.shape = frame.shape
+                self._free.clear()
+            if len(self._free) < self.size:
+                self._free.append(frame)
+
+
+# We define a bounded frame queue that discards the oldest frame when a new one arrives and it is full.
+# A dropped frame is passed to on_drop, which can give its buffer back to a FramePool.
+class LatestFrameQueue:
+    def __init__(self, maxsize: int = 2, on_drop=None):
+        # We keep the frames in a deque with a fixed maximum length.
+        self._frames = collections.deque(maxlen=maxsize)
+        self._condition = threading.Condition()
+        self._closed = False
+        self.on_drop = on_drop
+        # We count the frames that were discarded because inference was slower than the camera.
+        self.dropped_frames = 0
+
+    # Function to add a frame, dropping the oldest one if the queue is full.
+    def put(self, item):
+        dropped = None
+        with self._condition:
+            if len(self._frames) == self._frames.maxlen:
+                self.dropped_frames += 1
+                dropped = self._frames[0]
+            self._frames.append(item)
+            self._condition.notify()
+        if dropped is not None and self.on_drop is not None:
+            self.on_drop(dropped)
+
+    # Function to take the oldest waiting frame, or None if the queue was closed or the timeout expired.
+    def get(self, timeout=None):
+        with self._condition:
+            self._condition.wait_for(lambda: self._frames or self._closed, timeout)
+            if not self._frames:
+                return None
+            return self._frames.popleft()
+
+    # Function to wake up any waiting consumer so that it can stop.
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+# We define the thread that reads frames from the webcam at the camera's native frame rate.
+# With a governor, the frame rate and the resolution are adapted to the activity in front of the camera.
+# With a pool, the frames are read into its buffers, which the consumer of the frames gives back.
+class CaptureThread(threading.Thread):
+    def __init__(self, cap, frames: LatestFrameQueue, stop_event: threading.Event, governor=None, pool=None):
+        super().__init__(name="gesture-capture", daemon=True)
+        self.cap = cap
+        self.frames = frames
+        self.stop_event = stop_event
+        self.governor = governor
+        self.pool = pool
+
+    def run(self):
+        frame_idx = 0
+        last_read = time.monotonic()
+        while not self.stop_event.is_set():
+            if self.governor is not None:
+                # We wait until the governor's interval has passed since the previous frame.
+                delay = last_read + self.governor.interval() - time.monotonic()
+                if delay > 0 and self.stop_event.wait(delay):
+                    break
+                self.governor.apply(self.cap)
+            last_read = time.monotonic()
+            # The read blocks until the camera delivers the next frame. It decodes the frame into the buffer, unless
+            # the buffer does not have the size of the frame, in which case it allocates a new one.
+            buffer = self.pool.acquire() if self.pool is not None else None
+            ret, frame = self.cap.read(buffer)
+            if not ret:
+                if buffer is not None:
+                    self.pool.release(buffer)
+                # We back off briefly so that a disconnected camera does not spin the CPU.
+                time.sleep(0.05)
+                continue
+            self.frames.put((frame_idx, frame))
+            frame_idx += 1
+
+
+# We define the thread that runs hand detection and gesture classification on the captured frames.
+class InferenceThread(threading.Thread):
+    def __init__(self, detector, frames: LatestFrameQueue, results: queue.Queue, stop_event: threading.Event,
+                 governor=None, pool=None):
+        super().__init__(name="gesture-inference", daemon=True)
+        self.detector = detector
+        self.frames = frames
+        self.results = results
+        self.stop_event = stop_event
+        self.governor = governor
+        self.pool = pool
+
+    def run(self):
+        while not self.stop_event.is_set():
+            item = self.frames.get(timeout=0.5)
+            if item is None:
+                continue
+            frame_idx, frame = item
+            self.detector.metrics.set_counter('dropped_frames', self.frames.dropped_frames)
+            start = time.monotonic()
+            gesture = self.detector.detect_and_log(frame, frame_idx)
+            if self.pool is not None:
+                self.pool.release(frame)
+            # The frames skipped by the motion gate cost almost nothing, so they would make the governor raise the
+            # resolution while nobody is there.
+            if self.governor is not None and self.detector.last_frame_processed:
+                self.governor.report(self.detector.last_hand_count > 0, time.monotonic() - start)
+            # The results queue is the thread-safe channel back to the Tkinter main thread.
+            self.results.put((frame_idx, gesture))
+
+
+# We define the pipeline that connects the capture thread and the inference thread.
+# The frames are read into a pool of buffers with room for the waiting frames, the frame being read and the frame
+# being processed, so no frame is allocated once the pipeline runs.
+class GesturePipeline:
+    def __init__(self, detector, cap, max_pending_frames: int = 2, governor=None):
+        self.pool = FramePool(max_pending_frames + 2)
+        self.frames = LatestFrameQueue(max_pending_frames, on_drop=lambda item: self.pool.release(item[1]))
+        self.results = queue.Queue()
+        self._stop_event = threading.Event()
+        self._capture_thread = CaptureThread(cap, self.frames, self._stop_event, governor, self.pool)
+        self._inference_thread = InferenceThread(detector, self.frames, self.results, self._stop_event, governor,
+                                                 self.pool)
+
+    # Function to start both background threads.
+    def start(self):
+        self._capture_thread.start()
+        self._inference_thread.start()
+
+    # Function to collect every gesture recognized since the last call without blocking.
+    def poll(self):
+        gestures = []
+        while True:
+            try:
+                _, gesture = self.results.get_nowait()
+            except queue.Empty:
+                return gestures
+            gestures.append(gesture)
+
+    # Function to stop both background threads and wait for them to finish. It returns whether both finished
+    # within the timeout; otherwise a thread may still be blocked in cap.read() or in the detector, so the webcam
+    # and the detector must not be released.
+    def stop(self, timeout: float = 1.0):
+        self._stop_event.set()
+        self.frames.close()
+        for thread in (self._capture_thread, self._inference_thread):
+            if thread.is_alive():
+                thread.join(timeout)
+        return not (self._capture_thread.is_alive() or self._inference_thread.is_alive())
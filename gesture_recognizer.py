@@ -13,8 +13,16 @@
 # limitations under the License.
 """MediaPipe gesture recognizer task."""
 
+import asyncio
+import collections
 import dataclasses
-from typing import Callable, Mapping, Optional, List
+import enum
+import operator
+import threading
+import time
+from typing import AsyncIterator, Callable, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
 
 from mediapipe.framework.formats import classification_pb2
 from mediapipe.framework.formats import landmark_pb2
@@ -60,6 +68,10 @@ _TASK_GRAPH_NAME = (
 )
 _MICRO_SECONDS_PER_MILLISECOND = 1000
 _GESTURE_DEFAULT_INDEX = -1
+_NUM_HAND_LANDMARKS = 21
+_NO_CATEGORY_ID = -1
+
+_landmark_xyz = operator.attrgetter('x', 'y', 'z')
 
 
 @dataclasses.dataclass
@@ -81,23 +93,216 @@ class GestureRecognizerResult:
   hand_world_landmarks: List[List[landmark_module.Landmark]]
 
 
-def _build_recognition_result(
+class _CategoryTable:
+  """Assigns compact integer ids to the categories seen in recognition results.
+
+  The table is shared by all array results, so that a result only stores the
+  ids of its categories. Ids are never reassigned.
+
+  Attributes:
+    names: The `(category_name, display_name)` pair of each id.
+  """
+
+  def __init__(self):
+    self.names: List[Tuple[str, str]] = []
+    self._ids = {}
+    self._lock = threading.Lock()
+
+  def id_of(self, category_name: str, display_name: str) -> int:
+    """Returns the id of a category, assigning a new id to unseen categories."""
+    key = (category_name, display_name)
+    category_id = self._ids.get(key)
+    if category_id is None:
+      with self._lock:
+        category_id = self._ids.get(key)
+        if category_id is None:
+          category_id = len(self.names)
+          self.names.append(key)
+          self._ids[key] = category_id
+    return category_id
+
+
+_CATEGORY_TABLE = _CategoryTable()
+
+
+@dataclasses.dataclass(eq=False)
+class GestureRecognizerArrayResult:
+  """The gesture recognition result as NumPy arrays, with one row per detected hand.
+
+  The arrays are filled directly from the output protos, without creating a
+  Python object per landmark or per category. Categories are stored as ids into
+  `category_names`, and rows with fewer categories than the widest row are
+  padded with id -1 and a NaN score. The equivalent `GestureRecognizerResult` is
+  only built when `to_result` is called.
+  Results compare by identity, as the `==` of NumPy arrays has no single
+  truth value.
+
+  Attributes:
+    hand_landmarks: `(num_hands, 21, 3)` float32 landmarks in normalized image
+      coordinates.
+    hand_world_landmarks: `(num_hands, 21, 3)` float32 landmarks in world
+      coordinates.
+    gesture_ids: `(num_hands, num_gestures)` int32 category ids of the
+      recognized gestures of each hand, best first.
+    gesture_scores: `(num_hands, num_gestures)` float32 scores of the gestures.
+    handedness_ids: `(num_hands, num_handedness)` int32 category ids of the
+      handedness of each hand.
+    handedness_scores: `(num_hands, num_handedness)` float32 scores of the
+      handedness.
+    handedness_indices: `(num_hands, num_handedness)` int32 indices of the
+      handedness categories, as reported by the handedness classifier.
+    category_names: The `(category_name, display_name)` pair of each category
+      id, shared by all results.
+  """
+
+  hand_landmarks: np.ndarray
+  hand_world_landmarks: np.ndarray
+  gesture_ids: np.ndarray
+  gesture_scores: np.ndarray
+  handedness_ids: np.ndarray
+  handedness_scores: np.ndarray
+  handedness_indices: np.ndarray
+  category_names: Sequence[Tuple[str, str]] = dataclasses.field(
+      default_factory=lambda: _CATEGORY_TABLE.names, repr=False
+  )
+  _proto_lists: Optional[Tuple[list, list, list, list]] = dataclasses.field(
+      default=None, repr=False, compare=False
+  )
+  _result: Optional[GestureRecognizerResult] = dataclasses.field(
+      default=None, repr=False, compare=False
+  )
+
+  @classmethod
+  def empty(cls) -> 'GestureRecognizerArrayResult':
+    """Creates a result without any hand."""
+    landmarks = np.empty((0, _NUM_HAND_LANDMARKS, 3), dtype=np.float32)
+    ids = np.empty((0, 0), dtype=np.int32)
+    scores = np.empty((0, 0), dtype=np.float32)
+    return cls(landmarks, landmarks, ids, scores, ids, scores, ids)
+
+  @property
+  def num_hands(self) -> int:
+    """The number of detected hands."""
+    return len(self.hand_landmarks)
+
+  def top_gestures(self) -> Tuple[List[str], np.ndarray]:
+    """Returns the name and the score of the best gesture of each hand.
+
+    Returns:
+      The category names of the best gesture of each hand, or an empty string
+      for a hand without gesture, and a `(num_hands,)` float32 array of their
+      scores.
+    """
+    if not self.gesture_ids.size:
+      return [''] * self.num_hands, np.full(self.num_hands, np.nan, np.float32)
+    names = [
+        self.category_names[category_id][0] if category_id >= 0 else ''
+        for category_id in self.gesture_ids[:, 0].tolist()
+    ]
+    return names, self.gesture_scores[:, 0]
+
+  def to_result(self) -> GestureRecognizerResult:
+    """Converts this result to the equivalent `GestureRecognizerResult`.
+
+    The conversion is done once, on the first call, from the output protos.
+
+    Returns:
+      The `GestureRecognizerResult` with the same hands.
+    """
+    if self._result is None:
+      if self._proto_lists is None:
+        self._result = GestureRecognizerResult([], [], [], [])
+      else:
+        self._result = _build_recognition_result_from_protos(*self._proto_lists)
+    return self._result
+
+
+def _get_proto_lists(
     output_packets: Mapping[str, packet_module.Packet]
-) -> GestureRecognizerResult:
-  """Constructs a `GestureRecognizerResult` from output packets."""
-  gestures_proto_list = packet_getter.get_proto_list(
-      output_packets[_HAND_GESTURE_STREAM_NAME]
+) -> Tuple[list, list, list, list]:
+  """Gets the gesture, handedness, landmark and world landmark protos."""
+  return (
+      packet_getter.get_proto_list(output_packets[_HAND_GESTURE_STREAM_NAME]),
+      packet_getter.get_proto_list(output_packets[_HANDEDNESS_STREAM_NAME]),
+      packet_getter.get_proto_list(output_packets[_HAND_LANDMARKS_STREAM_NAME]),
+      packet_getter.get_proto_list(
+          output_packets[_HAND_WORLD_LANDMARKS_STREAM_NAME]
+      ),
+  )
+
+
+def _landmarks_to_array(landmark_protos: list) -> np.ndarray:
+  """Copies the coordinates of landmark list protos into a float32 array."""
+  if not landmark_protos:
+    return np.empty((0, _NUM_HAND_LANDMARKS, 3), dtype=np.float32)
+  return np.array(
+      [list(map(_landmark_xyz, proto.landmark)) for proto in landmark_protos],
+      dtype=np.float32,
+  )
+
+
+def _categories_to_arrays(
+    classification_protos: list,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+  """Copies classification list protos into id, score and index arrays."""
+  width = max(
+      (len(proto.classification) for proto in classification_protos),
+      default=0,
+  )
+  shape = (len(classification_protos), width)
+  ids = np.full(shape, _NO_CATEGORY_ID, dtype=np.int32)
+  scores = np.full(shape, np.nan, dtype=np.float32)
+  indices = np.full(shape, _NO_CATEGORY_ID, dtype=np.int32)
+  for row, proto in enumerate(classification_protos):
+    for column, classification in enumerate(proto.classification):
+      ids[row, column] = _CATEGORY_TABLE.id_of(
+          classification.label, classification.display_name
+      )
+      scores[row, column] = classification.score
+      indices[row, column] = classification.index
+  return ids, scores, indices
+
+
+def _build_array_result(
+    output_packets: Mapping[str, packet_module.Packet]
+) -> GestureRecognizerArrayResult:
+  """Constructs a `GestureRecognizerArrayResult` from output packets."""
+  proto_lists = _get_proto_lists(output_packets)
+  gestures_protos, handedness_protos, landmarks_protos, world_protos = (
+      proto_lists
   )
-  handedness_proto_list = packet_getter.get_proto_list(
-      output_packets[_HANDEDNESS_STREAM_NAME]
+  gesture_ids, gesture_scores, _ = _categories_to_arrays(gestures_protos)
+  handedness_ids, handedness_scores, handedness_indices = (
+      _categories_to_arrays(handedness_protos)
   )
-  hand_landmarks_proto_list = packet_getter.get_proto_list(
-      output_packets[_HAND_LANDMARKS_STREAM_NAME]
+  return GestureRecognizerArrayResult(
+      hand_landmarks=_landmarks_to_array(landmarks_protos),
+      hand_world_landmarks=_landmarks_to_array(world_protos),
+      gesture_ids=gesture_ids,
+      gesture_scores=gesture_scores,
+      handedness_ids=handedness_ids,
+      handedness_scores=handedness_scores,
+      handedness_indices=handedness_indices,
+      _proto_lists=proto_lists,
   )
-  hand_world_landmarks_proto_list = packet_getter.get_proto_list(
-      output_packets[_HAND_WORLD_LANDMARKS_STREAM_NAME]
+
+
+def _build_recognition_result(
+    output_packets: Mapping[str, packet_module.Packet]
+) -> GestureRecognizerResult:
+  """Constructs a `GestureRecognizerResult` from output packets."""
+  return _build_recognition_result_from_protos(
+      *_get_proto_lists(output_packets)
   )
 
+
+def _build_recognition_result_from_protos(
+    gestures_proto_list: list,
+    handedness_proto_list: list,
+    hand_landmarks_proto_list: list,
+    hand_world_landmarks_proto_list: list,
+) -> GestureRecognizerResult:
+  """Constructs a `GestureRecognizerResult` from the output protos."""
   gesture_results = []
   for proto in gestures_proto_list:
     gesture_categories = []
@@ -190,6 +395,10 @@ class GestureRecognizerOptions:
     result_callback: The user-defined result callback for processing live stream
       data. The result callback should only be specified when the running mode
       is set to the live stream mode.
+    output_arrays: Whether the results are `GestureRecognizerArrayResult`s,
+      which hold the landmarks and the categories in NumPy arrays, instead of
+      `GestureRecognizerResult`s. This avoids creating a Python object per
+      landmark and per category on every frame.
   """
 
   base_options: _BaseOptions
@@ -205,8 +414,16 @@ class GestureRecognizerOptions:
       default_factory=_ClassifierOptions
   )
   result_callback: Optional[
-      Callable[[GestureRecognizerResult, image_module.Image, int], None]
+      Callable[
+          [
+              Union[GestureRecognizerResult, GestureRecognizerArrayResult],
+              image_module.Image,
+              int,
+          ],
+          None,
+      ]
   ] = None
+  output_arrays: bool = False
 
   @doc_controls.do_not_generate_docs
   def to_pb2(self) -> _GestureRecognizerGraphOptionsProto:
@@ -254,6 +471,9 @@ class GestureRecognizerOptions:
 class GestureRecognizer(base_vision_task_api.BaseVisionTaskApi):
   """Class that performs gesture recognition on images."""
 
+  # Whether the results are `GestureRecognizerArrayResult`s.
+  _output_arrays = False
+
   @classmethod
   def create_from_model_path(cls, model_path: str) -> 'GestureRecognizer':
     """Creates an `GestureRecognizer` object from a TensorFlow Lite model and the default `GestureRecognizerOptions`.
@@ -297,6 +517,15 @@ class GestureRecognizer(base_vision_task_api.BaseVisionTaskApi):
       RuntimeError: If other types of error occurred.
     """
 
+    if options.output_arrays:
+      build_result = _build_array_result
+      empty_result = GestureRecognizerArrayResult.empty
+    else:
+      build_result = _build_recognition_result
+
+      def empty_result():
+        return GestureRecognizerResult([], [], [], [])
+
     def packets_callback(output_packets: Mapping[str, packet_module.Packet]):
       if output_packets[_IMAGE_OUT_STREAM_NAME].is_empty():
         return
@@ -306,13 +535,13 @@ class GestureRecognizer(base_vision_task_api.BaseVisionTaskApi):
       if output_packets[_HAND_GESTURE_STREAM_NAME].is_empty():
         empty_packet = output_packets[_HAND_GESTURE_STREAM_NAME]
         options.result_callback(
-            GestureRecognizerResult([], [], [], []),
+            empty_result(),
             image,
             empty_packet.timestamp.value // _MICRO_SECONDS_PER_MILLISECOND,
         )
         return
 
-      gesture_recognizer_result = _build_recognition_result(output_packets)
+      gesture_recognizer_result = build_result(output_packets)
       timestamp = output_packets[_HAND_GESTURE_STREAM_NAME].timestamp
       options.result_callback(
           gesture_recognizer_result,
@@ -337,7 +566,7 @@ class GestureRecognizer(base_vision_task_api.BaseVisionTaskApi):
         ],
         task_options=options,
     )
-    return cls(
+    recognizer = cls(
         task_info.generate_graph_config(
             enable_flow_limiting=options.running_mode
             == _RunningMode.LIVE_STREAM
@@ -345,12 +574,26 @@ class GestureRecognizer(base_vision_task_api.BaseVisionTaskApi):
         options.running_mode,
         packets_callback if options.result_callback else None,
     )
+    recognizer._output_arrays = options.output_arrays
+    return recognizer
+
+  def _build_result(
+      self, output_packets: Mapping[str, packet_module.Packet]
+  ) -> Union[GestureRecognizerResult, GestureRecognizerArrayResult]:
+    """Constructs the result type selected by the options from output packets."""
+    if output_packets[_HAND_GESTURE_STREAM_NAME].is_empty():
+      if self._output_arrays:
+        return GestureRecognizerArrayResult.empty()
+      return GestureRecognizerResult([], [], [], [])
+    if self._output_arrays:
+      return _build_array_result(output_packets)
+    return _build_recognition_result(output_packets)
 
   def recognize(
       self,
       image: image_module.Image,
       image_processing_options: Optional[_ImageProcessingOptions] = None,
-  ) -> GestureRecognizerResult:
+  ) -> Union[GestureRecognizerResult, GestureRecognizerArrayResult]:
     """Performs hand gesture recognition on the given image.
 
     Only use this method when the GestureRecognizer is created with the image
@@ -365,7 +608,8 @@ class GestureRecognizer(base_vision_task_api.BaseVisionTaskApi):
       image_processing_options: Options for image processing.
 
     Returns:
-      The hand gesture recognition results.
+      The hand gesture recognition results, as a
+      `GestureRecognizerArrayResult` if `output_arrays` is set in the options.
 
     Raises:
       ValueError: If any of the input arguments is invalid.
@@ -381,17 +625,14 @@ class GestureRecognizer(base_vision_task_api.BaseVisionTaskApi):
         ),
     })
 
-    if output_packets[_HAND_GESTURE_STREAM_NAME].is_empty():
-      return GestureRecognizerResult([], [], [], [])
-
-    return _build_recognition_result(output_packets)
+    return self._build_result(output_packets)
 
   def recognize_for_video(
       self,
       image: image_module.Image,
       timestamp_ms: int,
       image_processing_options: Optional[_ImageProcessingOptions] = None,
-  ) -> GestureRecognizerResult:
+  ) -> Union[GestureRecognizerResult, GestureRecognizerArrayResult]:
     """Performs gesture recognition on the provided video frame.
 
     Only use this method when the GestureRecognizer is created with the video
@@ -408,7 +649,8 @@ class GestureRecognizer(base_vision_task_api.BaseVisionTaskApi):
       image_processing_options: Options for image processing.
 
     Returns:
-      The hand gesture recognition results.
+      The hand gesture recognition results, as a
+      `GestureRecognizerArrayResult` if `output_arrays` is set in the options.
 
     Raises:
       ValueError: If any of the input arguments is invalid.
@@ -426,10 +668,7 @@ class GestureRecognizer(base_vision_task_api.BaseVisionTaskApi):
         ).at(timestamp_ms * _MICRO_SECONDS_PER_MILLISECOND),
     })
 
-    if output_packets[_HAND_GESTURE_STREAM_NAME].is_empty():
-      return GestureRecognizerResult([], [], [], [])
-
-    return _build_recognition_result(output_packets)
+    return self._build_result(output_packets)
 
   def recognize_async(
       self,
@@ -478,3 +717,210 @@ class GestureRecognizer(base_vision_task_api.BaseVisionTaskApi):
             normalized_rect.to_pb2()
         ).at(timestamp_ms * _MICRO_SECONDS_PER_MILLISECOND),
     })
+
+
+class BackpressurePolicy(enum.Enum):
+  """What `GestureRecognizerStream.submit` does when too many frames are in flight.
+
+  Attributes:
+    DROP: The new frame is not submitted, so the caller never waits and the
+      recognizer always works on the most recent frames.
+    WAIT: The caller waits until the result of an earlier frame is delivered.
+  """
+
+  DROP = 'drop'
+  WAIT = 'wait'
+
+
+@dataclasses.dataclass
+class GestureStreamResult:
+  """A result delivered by `GestureRecognizerStream`.
+
+  Attributes:
+    result: The hand gesture recognition results.
+    image: The input image that the gesture recognizer ran on.
+    timestamp_ms: The timestamp of the input image in milliseconds.
+  """
+
+  result: Union[GestureRecognizerResult, GestureRecognizerArrayResult]
+  image: image_module.Image
+  timestamp_ms: int
+
+
+class GestureRecognizerStream:
+  """Asyncio adapter around the live stream mode of `GestureRecognizer`.
+
+  Frames are submitted with `submit`, which stamps them with monotonically
+  increasing timestamps and sends them with `recognize_async`. The results,
+  which MediaPipe delivers on its own thread, are handed over to the event loop
+  and yielded in timestamp order by iterating over the stream:
+
+    async with GestureRecognizerStream(options) as stream:
+      ...  # A producer task calls `await stream.submit(image)`.
+      async for stream_result in stream:
+        ...
+
+  At most `max_in_flight` frames are submitted without a result; further frames
+  are dropped or wait, depending on the backpressure policy. A frame that the
+  graph drops to keep up with the stream is counted in `skipped_frames`.
+
+  Attributes:
+    max_in_flight: The maximum number of submitted frames without a result.
+    policy: The backpressure policy applied when `max_in_flight` is reached.
+    submitted_frames: The number of frames sent to the recognizer.
+    dropped_frames: The number of frames dropped by the `DROP` policy.
+    skipped_frames: The number of submitted frames that the graph dropped.
+  """
+
+  def __init__(
+      self,
+      options: GestureRecognizerOptions,
+      max_in_flight: int = 2,
+      policy: BackpressurePolicy = BackpressurePolicy.DROP,
+  ):
+    """Initializes the stream; the recognizer is created by `start`.
+
+    Args:
+      options: Options for the gesture recognizer task. The running mode is set
+        to the live stream mode and the result callback to the stream's own.
+      max_in_flight: The maximum number of submitted frames without a result.
+      policy: The backpressure policy applied when `max_in_flight` is reached.
+
+    Raises:
+      ValueError: If `options` already has a result callback.
+    """
+    if options.result_callback is not None:
+      raise ValueError(
+          'The result callback of a GestureRecognizerStream is its own.'
+      )
+    self._options = dataclasses.replace(
+        options,
+        running_mode=_RunningMode.LIVE_STREAM,
+        result_callback=self._on_result,
+    )
+    self.max_in_flight = max_in_flight
+    self.policy = BackpressurePolicy(policy)
+    self.submitted_frames = 0
+    self.dropped_frames = 0
+    self.skipped_frames = 0
+    self._recognizer = None
+    self._loop = None
+    self._results = None
+    self._in_flight = collections.deque()
+    self._slot_freed = None
+    self._start_ns = 0
+    self._last_timestamp_ms = -1
+    self._closed = False
+
+  def start(self) -> None:
+    """Creates the recognizer. It must be called from the event loop.
+
+    Raises:
+      ValueError: If failed to create the `GestureRecognizer`.
+      RuntimeError: If other types of error occurred.
+    """
+    self._loop = asyncio.get_running_loop()
+    self._results = asyncio.Queue()
+    self._slot_freed = asyncio.Event()
+    self._start_ns = time.monotonic_ns()
+    self._recognizer = GestureRecognizer.create_from_options(self._options)
+
+  def _next_timestamp_ms(self) -> int:
+    """Returns the time since `start` in milliseconds, always increasing."""
+    elapsed_ms = (time.monotonic_ns() - self._start_ns) // 1_000_000
+    self._last_timestamp_ms = max(elapsed_ms, self._last_timestamp_ms + 1)
+    return self._last_timestamp_ms
+
+  async def submit(
+      self,
+      image: image_module.Image,
+      image_processing_options: Optional[_ImageProcessingOptions] = None,
+  ) -> Optional[int]:
+    """Sends a frame to the recognizer, applying the backpressure policy.
+
+    Args:
+      image: MediaPipe Image.
+      image_processing_options: Options for image processing.
+
+    Returns:
+      The timestamp in milliseconds given to the frame, or None if the frame
+      was dropped.
+
+    Raises:
+      RuntimeError: If the stream was closed.
+    """
+    while len(self._in_flight) >= self.max_in_flight and not self._closed:
+      if self.policy is BackpressurePolicy.DROP:
+        self.dropped_frames += 1
+        return None
+      self._slot_freed.clear()
+      await self._slot_freed.wait()
+    if self._closed:
+      raise RuntimeError('The GestureRecognizerStream is closed.')
+
+    timestamp_ms = self._next_timestamp_ms()
+    self._in_flight.append(timestamp_ms)
+    self.submitted_frames += 1
+    self._recognizer.recognize_async(
+        image, timestamp_ms, image_processing_options
+    )
+    return timestamp_ms
+
+  def _on_result(
+      self,
+      result: Union[GestureRecognizerResult, GestureRecognizerArrayResult],
+      image: image_module.Image,
+      timestamp_ms: int,
+  ) -> None:
+    """Hands a result over to the event loop; runs on MediaPipe's thread."""
+    self._loop.call_soon_threadsafe(
+        self._deliver, GestureStreamResult(result, image, timestamp_ms)
+    )
+
+  def _deliver(self, stream_result: GestureStreamResult) -> None:
+    """Queues a result and frees the slots of the frames it completes."""
+    # The results come in timestamp order, so the frames submitted before
+    # this one that are still in flight were dropped by the graph.
+    while self._in_flight and self._in_flight[0] <= stream_result.timestamp_ms:
+      if self._in_flight.popleft() < stream_result.timestamp_ms:
+        self.skipped_frames += 1
+    self._slot_freed.set()
+    self._results.put_nowait(stream_result)
+
+  def __aiter__(self) -> AsyncIterator[GestureStreamResult]:
+    return self
+
+  async def __anext__(self) -> GestureStreamResult:
+    """Waits for the next result, in timestamp order.
+
+    Raises:
+      StopAsyncIteration: Once the stream is closed and every result was
+        yielded.
+    """
+    stream_result = await self._results.get()
+    if stream_result is None:
+      # We put the end marker back for any other consumer.
+      self._results.put_nowait(None)
+      raise StopAsyncIteration
+    return stream_result
+
+  async def close(self) -> None:
+    """Closes the recognizer after its pending results are delivered."""
+    if self._closed:
+      return
+    self._closed = True
+    if self._loop is None:
+      return
+    if self._recognizer is not None:
+      # Closing waits for the graph to finish, so it runs off the event loop.
+      await self._loop.run_in_executor(None, self._recognizer.close)
+    # The results delivered while closing are queued before the end marker.
+    self._loop.call_soon(self._results.put_nowait, None)
+    self._slot_freed.set()
+
+  async def __aenter__(self) -> 'GestureRecognizerStream':
+    self.start()
+    return self
+
+  async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+    await self.close()
@@ -0,0 +1,177 @@
+# We import the modules needed to cache decoded and resized paintings and to prepare them in the background.
+import collections
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageTk
+
+
+# Function to compute the size of an image resized to fit in the target area while keeping its aspect ratio.
+def fit_size(image_width, image_height, target_width, target_height):
+    image_ratio = image_width / image_height
+    target_ratio = target_width / target_height
+    if image_ratio > target_ratio:
+        return target_width, int(target_width / image_ratio)
+    return int(target_height * image_ratio), target_height
+
+
+# Function to estimate the memory used by the pixels of an image.
+def image_nbytes(image):
+    return image.width * image.height * len(image.getbands())
+
+
+# We define a thread-safe least-recently-used cache bounded by the total size of its values in bytes.
+class LRUByteCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    # Function to get a value and mark it as recently used, or None if it is not cached.
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    # Function to add a value and evict the least recently used values until the cache fits its budget.
+    def put(self, key, value, nbytes: int):
+        with self._lock:
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self.current_bytes -= old_entry[1]
+            self._entries[key] = (value, nbytes)
+            self.current_bytes += nbytes
+            # The newest value is always kept, even if it is larger than the whole budget.
+            while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_bytes
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+
+# We define the cache of the gallery's paintings: decoded images, renditions resized for the window,
+# and the Tkinter images made from them. Renditions of neighboring paintings can be prefetched.
+# With an ArtworkStore, the renditions are resized from the smallest pre-built level that covers them.
+class ImageCache:
+    def __init__(self, decoded_max_bytes: int = 192 * 2**20, rendition_max_bytes: int = 64 * 2**20,
+                 photo_max_bytes: int = 64 * 2**20, store=None):
+        self.store = store
+        self.decoded = LRUByteCache(decoded_max_bytes)  # Decoded images, keyed by path.
+        self.renditions = LRUByteCache(rendition_max_bytes)  # Resized images, keyed by (path, size).
+        # Tkinter images, keyed by (path, size). They must only be created and used on the Tkinter main thread.
+        self.photos = LRUByteCache(photo_max_bytes)
+        self._sizes = {}  # Dimensions of each image, read from the file header.
+        self._rendition_sizes = {}  # Size of the latest rendition of each image, used for previews.
+        self._in_progress = {}  # Events for the values being computed, so that they are computed only once.
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-prefetch")
+
+    # Function to get the dimensions of an image without decoding it.
+    def image_size(self, path):
+        size = self._sizes.get(path)
+        if size is None and self.store is not None:
+            size = self.store.image_size(path)
+        if size is None:
+            with Image.open(path) as image:
+                size = image.size
+        self._sizes[path] = size
+        return size
+
+    # Function to compute the size of the rendition of an image that fits in the window.
+    def display_size(self, path, window_width, window_height):
+        return fit_size(*self.image_size(path), window_width, window_height)
+
+    # Function to get the decoded image, reading it from disk if it is not cached.
+    def load(self, path):
+        def decode():
+            image = Image.open(path)
+            image.load()
+            return image
+        return self._compute_once(self.decoded, path, decode)
+
+    # Function to get the image resized to the given size with high quality, resizing it if it is not cached.
+    def rendition(self, path, size):
+        source = self.store.source_for(path, size) if self.store is not None else path
+        rendition = self._compute_once(self.renditions, (path, size),
+                                       lambda: self.load(source).resize(size, Image.LANCZOS))
+        self._rendition_sizes[path] = size
+        return rendition
+
+    # Function to get a quick low-quality Tkinter image of the given size, for example while the window is resized.
+    # It is scaled from the latest cached rendition when there is one, which is much smaller than the original.
+    # It must be called on the Tkinter main thread.
+    def preview(self, path, size):
+        source = None
+        if path in self._rendition_sizes:
+            source = self.renditions.get((path, self._rendition_sizes[path]))
+        if source is None:
+            source = self.load(self.store.smallest_source(path) if self.store is not None else path)
+            resample = Image.NEAREST  # The source can be very large, so we use the fastest resampling.
+        else:
+            resample = Image.BILINEAR
+        return ImageTk.PhotoImage(source.resize(size, resample))
+
+    # Function to get the Tkinter image of a rendition. It must be called on the Tkinter main thread.
+    def photo(self, path, size):
+        key = (path, size)
+        photo = self.photos.get(key)
+        if photo is None:
+            rendition = self.rendition(path, size)
+            photo = ImageTk.PhotoImage(rendition)
+            self.photos.put(key, photo, image_nbytes(rendition))
+        return photo
+
+    # Function to prepare in the background the renditions of the given images for the window size.
+    def prefetch(self, paths, window_width, window_height):
+        for path in paths:
+            self._executor.submit(self._prefetch_one, path, window_width, window_height)
+
+    def _prefetch_one(self, path, window_width, window_height):
+        try:
+            size = self.display_size(path, window_width, window_height)
+            if size[0] > 0 and size[1] > 0:
+                self.rendition(path, size)
+        except OSError as e:
+            print(f"Warning: Could not prefetch {path}: {e}")
+
+    # Function to get a value from a cache, computing it at most once even if several threads ask for it.
+    def _compute_once(self, cache, key, compute):
+        while True:
+            value = cache.get(key)
+            if value is not None:
+                return value
+            with self._lock:
+                event = self._in_progress.get(key)
+                is_owner = event is None
+                if is_owner:
+                    event = self._in_progress[key] = threading.Event()
+            if is_owner:
+                break
+            # Another thread is computing the value, so we wait for it and look in the cache again.
+            event.wait()
+
+        try:
+            value = compute()
+            cache.put(key, value, image_nbytes(value))
+            return value
+        finally:
+            with self._lock:
+                del self._in_progress[key]
+            event.set()
+
+    # Function to stop the prefetching and release the cached images.
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.photos.clear()
+        self.renditions.clear()
+        self.decoded.clear()
@@ -0,0 +1,200 @@
+# We import NumPy, which is the only module needed to run the exported gesture model.
+import hashlib
+import numpy as np
+from gesture_features import DEFAULT_FEATURE_SET, landmark_features, model_feature_set
+
+# The file in which the exported gesture model is stored.
+LINEAR_MODEL_PATH = 'gesture_model.npz'
+
+# The smallest pairwise probability used by libsvm when it couples the one-vs-one probabilities.
+_MIN_PAIRWISE_PROBABILITY = 1e-7
+
+# The largest difference allowed between the probabilities of the exported model and of the sklearn model.
+# The direct solution of the pairwise coupling differs from libsvm's iterations by about 1e-3 at most
+# (8.6e-4 for the shipped model, 1.2e-3 for a freshly trained one).
+PARITY_TOLERANCE = 2e-3
+
+
+# We define a linear one-vs-one SVM classifier that only needs NumPy to predict gestures.
+# It reproduces SVC.predict and SVC.predict_proba of the pipeline built in train_model.py,
+# with the StandardScaler folded into the weights of each pair of classes.
+class LinearGestureModel:
+    def __init__(self, weights, intercepts, classes, prob_a=None, prob_b=None, source_digest: str = '',
+                 feature_set: str = DEFAULT_FEATURE_SET):
+        # The weights are stored transposed, so that the decision values are a single matrix product.
+        self.weights = np.ascontiguousarray(np.asarray(weights, dtype=np.float64).T)
+        self.intercepts = np.asarray(intercepts, dtype=np.float64)
+        self.classes_ = np.asarray(classes)
+        # The pairs of classes are ordered as in libsvm: (0, 1), (0, 2), ..., (1, 2), ...
+        self._pair_first, self._pair_second = np.triu_indices(len(self.classes_), 1)
+        self.prob_a = None if prob_a is None or len(prob_a) == 0 else np.asarray(prob_a, dtype=np.float64)
+        self.prob_b = None if prob_b is None or len(prob_b) == 0 else np.asarray(prob_b, dtype=np.float64)
+        # The SHA-256 digest of the pickled sklearn model this model was exported from.
+        self.source_digest = source_digest
+        # The features the model was trained on, computed from the landmarks by gesture_features.py.
+        self.feature_set_ = feature_set
+
+    # Function to build the model from a fitted SVC with a linear kernel, or a pipeline ending in one.
+    @classmethod
+    def from_sklearn(cls, model, source_digest: str = ''):
+        steps = [step for _, step in model.steps] if hasattr(model, 'steps') else [model]
+        svc = steps[-1]
+        if getattr(svc, 'kernel', None) != 'linear':
+            raise ValueError("Only an SVC with a linear kernel can be exported.")
+
+        # We fold the preprocessing steps into the weights: w . (x - mean) / scale + b = (w / scale) . x + b'.
+        n_features = svc.coef_.shape[1]
+        mean = np.zeros(n_features)
+        scale = np.ones(n_features)
+        for step in steps[:-1]:
+            if not hasattr(step, 'scale_') and not hasattr(step, 'mean_'):
+                raise ValueError(f"Cannot fold the preprocessing step {type(step).__name__} into the model.")
+            step_mean = step.mean_ if getattr(step, 'mean_', None) is not None else 0.0
+            step_scale = step.scale_ if getattr(step, 'scale_', None) is not None else 1.0
+            # Composing two affine steps: ((x - m1) / s1 - m2) / s2 = (x - (m1 + m2 * s1)) / (s1 * s2).
+            mean = mean + step_mean * scale
+            scale = scale * step_scale
+
+        coef = np.asarray(svc.coef_, dtype=np.float64)
+        intercept = np.asarray(svc.intercept_, dtype=np.float64)
+        weights = coef / scale
+        intercepts = intercept - weights @ mean
+        if len(svc.classes_) == 2:
+            # sklearn flips the sign of a binary SVC, while the probabilities are calibrated on libsvm's sign.
+            weights, intercepts = -weights, -intercepts
+
+        prob_a = getattr(svc, 'probA_', None)
+        prob_b = getattr(svc, 'probB_', None)
+        return cls(weights, intercepts, svc.classes_, prob_a, prob_b, source_digest, model_feature_set(model))
+
+    # Function to load the model from an .npz file written by save().
+    @classmethod
+    def load(cls, path: str = LINEAR_MODEL_PATH):
+        with np.load(path, allow_pickle=False) as data:
+            # The models exported before feature sets existed were trained on raw landmarks.
+            feature_set = str(data['feature_set']) if 'feature_set' in data.files else DEFAULT_FEATURE_SET
+            return cls(data['weights'], data['intercepts'], data['classes'], data['prob_a'], data['prob_b'],
+                       str(data['source_digest']), feature_set)
+
+    # Function to save the model in an .npz file that can be loaded without pickle.
+    def save(self, path: str = LINEAR_MODEL_PATH):
+        empty = np.empty(0)
+        np.savez(path,
+                 weights=self.weights.T,
+                 intercepts=self.intercepts,
+                 classes=self.classes_.astype(str),
+                 prob_a=self.prob_a if self.prob_a is not None else empty,
+                 prob_b=self.prob_b if self.prob_b is not None else empty,
+                 source_digest=np.array(self.source_digest),
+                 feature_set=np.array(self.feature_set_))
+
+    # Function to compute the decision value of every pair of classes for each sample.
+    def decision_function(self, X):
+        return np.asarray(X, dtype=np.float64) @ self.weights + self.intercepts
+
+    # Function to predict the gestures by one-vs-one voting, like libsvm does.
+    def predict(self, X):
+        decisions = self.decision_function(X)
+        n_samples, n_classes = len(decisions), len(self.classes_)
+        winners = np.where(decisions > 0, self._pair_first, self._pair_second)
+        # We count the votes of all samples at once by offsetting the winners of each sample.
+        winners += np.arange(n_samples)[:, None] * n_classes
+        votes = np.bincount(winners.ravel(), minlength=n_samples * n_classes).reshape(n_samples, n_classes)
+        # Ties go to the class with the lowest index, as in libsvm.
+        return self.classes_[votes.argmax(axis=1)]
+
+    # Function to estimate the probability of every gesture with libsvm's pairwise coupling method.
+    def predict_proba(self, X):
+        if self.prob_a is None:
+            raise AttributeError("The exported model was trained without probability estimates.")
+        decisions = self.decision_function(X)
+        n_samples, n_classes = len(decisions), len(self.classes_)
+
+        # We compute the Platt-scaled probability of the first class of each pair: 1 / (1 + exp(A * f + B)).
+        pairwise = np.exp(-np.logaddexp(0.0, decisions * self.prob_a + self.prob_b))
+        pairwise = np.clip(pairwise, _MIN_PAIRWISE_PROBABILITY, 1 - _MIN_PAIRWISE_PROBABILITY)
+        r = np.zeros((n_samples, n_classes, n_classes))
+        r[:, self._pair_first, self._pair_second] = pairwise
+        r[:, self._pair_second, self._pair_first] = 1 - pairwise
+        return _couple_pairwise_probabilities(r)
+
+
+# Function to combine the pairwise probabilities into class probabilities (Wu, Lin and Weng, 2004).
+# The probabilities minimize p^T Q p under sum(p) = 1. libsvm's multiclass_probability approaches this
+# minimum iteratively until it is within a tolerance; we solve the linear system of the minimum directly,
+# for all samples at once, which is an order of magnitude faster in NumPy. Since libsvm stops before the exact
+# minimum, the probabilities differ by about 1e-3 at most, within PARITY_TOLERANCE.
+def _couple_pairwise_probabilities(r):
+    n_samples, k = r.shape[:2]
+
+    # Q[t][t] is the sum of r[j][t]^2 and Q[t][j] is -r[j][t] * r[t][j].
+    Q = -np.transpose(r, (0, 2, 1)) * r
+    Q[:, np.arange(k), np.arange(k)] = np.einsum('sjt,sjt->st', r, r)
+
+    # The minimum satisfies [[Q, 1], [1^T, 0]] [p, b] = [0, 1], where b is the Lagrange multiplier.
+    system = np.ones((n_samples, k + 1, k + 1))
+    system[:, :k, :k] = Q
+    system[:, k, k] = 0.0
+    rhs = np.zeros((n_samples, k + 1, 1))
+    rhs[:, k] = 1.0
+    return np.linalg.solve(system, rhs)[:, :k, 0]
+
+
+# Function to compute the digest that ties an exported model to the pickled model file it came from.
+def file_digest(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+# Function to compare the exported model with the sklearn model it was built from.
+# It returns the fraction of identical predictions and the largest difference between the probabilities.
+def check_parity(sklearn_model, linear_model, X):
+    agreement = np.mean(sklearn_model.predict(X) == linear_model.predict(X))
+    max_probability_error = 0.0
+    if linear_model.prob_a is not None:
+        max_probability_error = np.abs(sklearn_model.predict_proba(X) - linear_model.predict_proba(X)).max()
+    return agreement, max_probability_error
+
+
+# Function to check the parity of an exported model before it is saved. It raises a RuntimeError if a prediction
+# differs or a probability differs by more than PARITY_TOLERANCE, and returns the parity otherwise.
+def verify_parity(sklearn_model, linear_model, X):
+    agreement, max_probability_error = check_parity(sklearn_model, linear_model, X)
+    print(f"Prediction agreement: {agreement:.2%}, largest probability difference: {max_probability_error:.2e}")
+    if agreement < 1.0 or max_probability_error > PARITY_TOLERANCE:
+        raise RuntimeError("The exported model does not match the sklearn model; it was not saved.")
+    return agreement, max_probability_error
+
+
+# Function to export the pickled sklearn model to the NumPy model and check that both agree.
+def export_model(model_path: str = 'gesture_model.pkl', data_path: str = 'gesture_dataset',
+                 output_path: str = LINEAR_MODEL_PATH):
+    import pickle
+    import time
+    from gesture_dataset import load_dataset
+
+    with open(model_path, 'rb') as f:
+        sklearn_model = pickle.load(f)
+    linear_model = LinearGestureModel.from_sklearn(sklearn_model, file_digest(model_path))
+
+    # We check the parity on the recorded gesture data, one feature vector per sample.
+    landmarks, _ = load_dataset(data_path).features_and_labels()
+    X = landmark_features(landmarks, linear_model.feature_set_)
+    verify_parity(sklearn_model, linear_model, X)
+
+    # We compare the latency of a single prediction, as done for every frame.
+    sample = X[:1]
+    for name, model in (("sklearn", sklearn_model), ("numpy", linear_model)):
+        start = time.perf_counter()
+        for _ in range(200):
+            model.predict(sample)
+        print(f"{name} predict: {(time.perf_counter() - start) / 200 * 1e6:.1f} us")
+
+    linear_model.save(output_path)
+    print(f"Model exported to {output_path}.")
+    return linear_model
+
+
+# If the file is run directly, we export 'gesture_model.pkl' to 'gesture_model.npz'.
+if __name__ == "__main__":
+    export_model()
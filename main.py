@@ -2,23 +2,28 @@
 import cv2
 import numpy as np
 import mediapipe as mp
-import pickle
+import argparse
 import itertools
 import tqdm
-from sklearn.svm import SVC
+from gesture_detector import NUM_LANDMARK_FEATURES, GestureSmoother, bgr_to_rgb, landmarks_to_array, load_gesture_model
+from gesture_features import landmark_features, model_feature_set
+from gesture_metrics import MetricsExporter, PipelineMetrics, parse_metrics_address
+from frame_governor import FrameRateGovernor
+import time
 
 # We define the GestureDetectorLogger class for gesture detection and logging.
 class GestureDetectorLogger:
-    def __init__(self, video_mode: bool = False):
+    def __init__(self, video_mode: bool = False, metrics=None):
         # We initialize the video mode.
         self._video_mode = video_mode
 
         # We load the trained gesture model from the file.
-        with open('gesture_model.pkl', 'rb') as f:
-            self.model = pickle.load(f)
+        self.model = load_gesture_model()
+        self.feature_set = model_feature_set(self.model)  # The features the model was trained on.
 
-        # We initialize the history of gestures and their labels.
-        self.gesture_history = []
+        # We initialize the confidence-weighted smoothing of the gestures, and their labels.
+        self.smoother = GestureSmoother(window=5)
+        self.confidence_weighting = hasattr(self.model, 'predict_proba')
         self.gesture_labels = ['Next', 'Previous', 'OK', 'Victory', 'Like', 'Dislike', 'Open Palm', 'Closed Palm']
 
         # We initialize the mediapipe for hand detection.
@@ -26,33 +31,54 @@ class GestureDetectorLogger:
         self.hands = self.mp_hands.Hands()
         self.mp_drawing = mp.solutions.drawing_utils
 
-    # Feature for detecting and logging gestures in an image.
+        # We preallocate the feature buffer for the maximum number of hands mediapipe looks for.
+        self._features = np.empty((2, NUM_LANDMARK_FEATURES), dtype=np.float32)
+        self._image_rgb = None  # The RGB conversion of the frame, reused for every frame.
+        self.last_hand_count = 0  # The number of hands detected in the last frame.
+
+        # We time the stages of every frame, if enabled.
+        self.metrics = metrics if metrics is not None else PipelineMetrics(enabled=False)
+
+    # Feature for detecting and logging gestures in a BGR image, on which the landmarks and the gesture are drawn.
     def detect_and_log(self, image, frame_idx: int) -> None:
-        # We get the dimensions of the image and convert it to RGB.
+        # We get the dimensions of the image and convert it to RGB, the only conversion of the frame.
+        metrics = self.metrics
+        frame_start = t = metrics.start()
         height, width, _ = image.shape
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        image_rgb = self._image_rgb = bgr_to_rgb(image, self._image_rgb)
+        t = metrics.lap('color_conversion', t)
         results = self.hands.process(image_rgb)
+        t = metrics.lap('hands_process', t)
 
         gesture_category = "None"
+        confidence = None  # A frame without hand weighs as much as the recent hands, see GestureSmoother.
+        self.last_hand_count = len(results.multi_hand_landmarks) if results.multi_hand_landmarks else 0
         # If hands were detected, we extract the coordinates of the landmarks and predict the gesture.
         if results.multi_hand_landmarks:
+            # We classify all detected hands with a single batched prediction.
+            if len(results.multi_hand_landmarks) > len(self._features):
+                self._features = np.empty((len(results.multi_hand_landmarks), NUM_LANDMARK_FEATURES), dtype=np.float32)
+            features = landmark_features(landmarks_to_array(results.multi_hand_landmarks, self._features),
+                                         self.feature_set)
+            t = metrics.lap('landmark_extraction', t)
+            if self.confidence_weighting:
+                probabilities = self.model.predict_proba(features)[-1]
+                gesture_category, confidence = self.model.classes_[probabilities.argmax()], probabilities.max()
+            else:
+                gesture_category = self.model.predict(features)[-1]
+            t = metrics.lap('predict', t)
             for hand_landmarks in results.multi_hand_landmarks:
-                landmarks = []
-                for lm in hand_landmarks.landmark:
-                    landmarks.append([lm.x, lm.y, lm.z])
-                landmarks = np.array(landmarks).flatten().reshape(1, -1)
-                gesture_category = self.model.predict(landmarks)[0]
                 self.mp_drawing.draw_landmarks(image, hand_landmarks, self.mp_hands.HAND_CONNECTIONS)
+            t = metrics.lap('draw', t)
+            metrics.increment('hands', self.last_hand_count)
+            metrics.increment('predictions', len(features))
 
-        # We add the detected gesture to the gesture history and keep its size to a maximum of 5.
-        self.gesture_history.append(gesture_category)
-        if len(self.gesture_history) > 5:
-            self.gesture_history.pop(0)
-
-        # We determine the most frequent gesture and display it on the image.
-        final_gesture = self.get_most_common_gesture()
+        # We add the detected gesture to the smoother and display the smoothed gesture on the image.
+        # The gesture is not printed, since writing to the console on every frame slows the loop down.
+        final_gesture = self.smoother.update(gesture_category, confidence)
         self.draw_gesture_indicator(image, final_gesture)
-        print("Gesture Category:", final_gesture)
+        metrics.lap('smoothing', t)
+        metrics.end_frame(frame_start)
 
     # Function to draw the gesture indicator on the image.
     def draw_gesture_indicator(self, image, gesture_name):
@@ -60,37 +86,55 @@ class GestureDetectorLogger:
 
     # Function to determine the most frequent gesture from the gesture history.
     def get_most_common_gesture(self):
-        if not self.gesture_history:
-            return "None"
-        return max(set(self.gesture_history), key=self.gesture_history.count)
+        return self.smoother.current
 
 # Function to run the application using the webcam.
-def run_from_webcam():
+# The metrics can be written to a file and/or served over HTTP, and toggled with the 'm' key.
+def run_from_webcam(metrics_file=None, metrics_address=None):
     cap = cv2.VideoCapture(0)
     if not cap.isOpened():
         print("Error: Could not open webcam.")
         return
 
-    detector = GestureDetectorLogger(video_mode=True)
+    # We set the capture resolution and adapt the frame rate to the presence of a hand and the processing time.
+    governor = FrameRateGovernor()
+    governor.configure(cap)
+
+    metrics = PipelineMetrics(enabled=bool(metrics_file or metrics_address))
+    exporter = MetricsExporter(metrics, metrics_file, metrics_address)
+    exporter.start()
+    detector = GestureDetectorLogger(video_mode=True, metrics=metrics)
 
     try:
+        # The frames are read into the same buffer, which is displayed before the next frame is read.
+        frame = None
         it = itertools.count()
         # We process the video frames using tqdm to display the progress.
         for frame_idx in tqdm.tqdm(it, desc="Processing frames"):
-            ret, frame = cap.read()
+            governor.apply(cap)
+            frame_start = time.monotonic()
+            ret, frame = cap.read(frame)
             if not ret:
                 print("Error: Could not read frame from webcam.")
                 break
 
-            # We convert the frame to RGB and detect the gestures.
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            detector.detect_and_log(frame_rgb, frame_idx)
+            # We detect the gestures, and draw them on the frame, which stays in BGR for display.
+            detect_start = time.monotonic()
+            detector.detect_and_log(frame, frame_idx)
+            governor.report(detector.last_hand_count > 0, time.monotonic() - detect_start)
 
             # We display the frame with the detected gestures.
-            cv2.imshow('Real-Time Gesture Recognition', cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2BGR))
+            cv2.imshow('Real-Time Gesture Recognition', frame)
 
-            if cv2.waitKey(1) & 0xFF == ord('q'):
+            # We wait for the next frame while handling the window events.
+            delay = governor.interval() - (time.monotonic() - frame_start)
+            key = cv2.waitKey(max(int(delay * 1000), 1)) & 0xFF
+            if key == ord('q'):
                 break
+            if key == ord('m'):
+                metrics.enabled = not metrics.enabled
+                if not metrics.enabled:
+                    print(metrics.summary())
 
     except Exception as e:
         print(f"An error occurred: {e}")
@@ -98,7 +142,13 @@ def run_from_webcam():
     finally:
         cap.release()
         cv2.destroyAllWindows()
+        exporter.stop()
 
 # If the file is run directly (not imported as a module), we call the run_from_webcam function to start the application.
 if __name__ == "__main__":
-    run_from_webcam()
+    parser = argparse.ArgumentParser(description="Real-time gesture recognition from the webcam.")
+    parser.add_argument('--metrics-file', help="File to which the metrics are written regularly.")
+    parser.add_argument('--metrics-address', type=parse_metrics_address,
+                        help="Address on which the metrics are served, as host:port or port.")
+    args = parser.parse_args()
+    run_from_webcam(args.metrics_file, args.metrics_address)
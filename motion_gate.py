@@ -0,0 +1,62 @@
+# We import the modules needed to detect motion in the webcam frames at a very small cost.
+import cv2
+import numpy as np
+
+
+# We define the gate that decides whether a frame is worth running the hand pipeline on. Each frame is reduced to
+# a tiny grayscale thumbnail and compared with a background model, a running average of the previous thumbnails.
+# The frame has motion when more than min_changed_fraction of the thumbnail's pixels differ from the background
+# by more than pixel_threshold gray levels. A lower threshold or fraction makes the gate more sensitive.
+# While a hand is tracked, every frame is let through, so that a hand holding a gesture still is recognized.
+# In case a hand entered without being detected and then stopped moving, a frame is let through every
+# max_skipped_frames frames even without motion.
+class MotionGate:
+    def __init__(self, pixel_threshold: float = 12.0, min_changed_fraction: float = 0.01,
+                 learning_rate: float = 0.05, thumbnail_size=(32, 24), oversampling: int = 4,
+                 max_skipped_frames: int = 30):
+        self.pixel_threshold = pixel_threshold
+        self.min_changed_fraction = min_changed_fraction
+        self.learning_rate = learning_rate  # The weight of each new thumbnail in the background model.
+        self.thumbnail_size = tuple(thumbnail_size)
+        self.oversampling = oversampling
+        self.max_skipped_frames = max_skipped_frames
+        self.processed_frames = 0  # The number of frames let through.
+        self.skipped_frames = 0  # The number of frames skipped because nothing moved.
+        self.reset()
+
+    # Function to forget the background, so that the next frame is let through.
+    def reset(self):
+        self._background = None
+        self._skipped_in_a_row = 0
+
+    # Function to reduce a BGR frame to a grayscale thumbnail. An area resize of the whole frame costs as much as a
+    # color conversion, so the frame is first sampled at a few times the thumbnail size, and those samples are
+    # averaged, which removes most of the camera noise.
+    def thumbnail(self, frame):
+        width, height = self.thumbnail_size
+        samples = cv2.resize(frame, (width * self.oversampling, height * self.oversampling),
+                             interpolation=cv2.INTER_NEAREST)
+        if samples.ndim == 3:
+            samples = cv2.cvtColor(samples, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(samples, self.thumbnail_size, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    # Function to update the background with a frame and return whether something moved in it.
+    def update(self, frame):
+        thumbnail = self.thumbnail(frame)
+        if self._background is None or self._background.shape != thumbnail.shape:
+            self._background = thumbnail
+            return True
+        changed = np.count_nonzero(cv2.absdiff(thumbnail, self._background) > self.pixel_threshold)
+        cv2.accumulateWeighted(thumbnail, self._background, self.learning_rate)
+        return changed > self.min_changed_fraction * thumbnail.size
+
+    # Function to decide whether a frame is processed, and count the processed and the skipped frames.
+    # The background is updated with every frame, so it is up to date when the tracked hand leaves.
+    def should_process(self, frame, hand_tracked: bool = False):
+        if self.update(frame) or hand_tracked or self._skipped_in_a_row >= self.max_skipped_frames:
+            self._skipped_in_a_row = 0
+            self.processed_frames += 1
+            return True
+        self._skipped_in_a_row += 1
+        self.skipped_frames += 1
+        return False
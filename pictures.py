@@ -1,5 +1,3 @@
-# We import the GestureDetector Logger class from the gesturedetector module.
-from gesture_detector import GestureDetectorLogger
 # We import the ArtApp class from the app module.
 from app import ArtApp
 # We import the tkinter module to create the GUI.
@@ -0,0 +1,270 @@
+# We import the modules needed to run one gesture recognition process per camera and to publish their gestures.
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import queue
+import secrets
+import threading
+import time
+from multiprocessing.connection import Client, Listener, answer_challenge, deliver_challenge
+
+# The default address of the pool's publisher, and the environment variable with its authentication key.
+# The pool and its frontends must share the key, so that no other process can publish or receive gestures.
+DEFAULT_ADDRESS = ('localhost', 6000)
+AUTHKEY_ENV = 'GESTURE_POOL_AUTHKEY'
+
+# The smoothed gesture recognized in a frame of a station.
+GestureUpdate = collections.namedtuple('GestureUpdate', ['station', 'frame_idx', 'timestamp', 'gesture'])
+
+
+# Function to get the authentication key of the pool: the given key, or the one of the environment variable,
+# or None if there is neither.
+def resolve_authkey(authkey=None):
+    authkey = authkey if authkey is not None else os.environ.get(AUTHKEY_ENV)
+    if isinstance(authkey, str):
+        authkey = authkey.encode('utf-8')
+    return authkey or None
+
+
+# Function to convert a source given on the command line to a device index or a video file path.
+def parse_source(source):
+    return int(source) if isinstance(source, str) and source.isdigit() else source
+
+
+# Function run by each station process: it reads the frames of its source, recognizes the gestures and
+# publishes the smoothed gesture of every frame. Publishing only the changes would hide from the frontends how
+# long a gesture is held, which their GestureEventMachine needs, as it gets with a local GesturePipeline.
+# It stops at the end of a video file or when asked to.
+def run_station(station, source, updates, stop_event, detector_options):
+    import cv2
+    from frame_governor import FrameRateGovernor
+    from gesture_backends import create_backend
+
+    cap = cv2.VideoCapture(parse_source(source))
+    if not cap.isOpened():
+        print(f"Error: Station {station} could not open {source}.")
+        return
+    is_camera = isinstance(parse_source(source), int)
+    governor = FrameRateGovernor() if is_camera else None
+    if governor is not None:
+        governor.configure(cap)
+    # The detector options select the backend of gesture_backends.py and hold its options.
+    detector = create_backend(**detector_options)
+
+    try:
+        frame_idx = 0
+        while not stop_event.is_set():
+            frame_start = time.monotonic()
+            if governor is not None:
+                governor.apply(cap)
+            ret, frame = cap.read()
+            if not ret:
+                if is_camera:
+                    # We back off briefly so that a disconnected camera does not spin the CPU.
+                    stop_event.wait(0.05)
+                    continue
+                break  # The end of the video file.
+
+            gesture = detector.detect_and_log(frame, frame_idx)
+            # The frames skipped by the motion gate are not reported, as in GesturePipeline.
+            if governor is not None and detector.last_frame_processed:
+                governor.report(detector.last_hand_count > 0, time.monotonic() - frame_start)
+            updates.put(GestureUpdate(station, frame_idx, time.time(), gesture))
+            frame_idx += 1
+
+            if governor is not None:
+                delay = governor.interval() - (time.monotonic() - frame_start)
+                if delay > 0:
+                    stop_event.wait(delay)
+    finally:
+        cap.release()
+        detector.close()
+
+
+# We define the pool of station processes. Each camera source is served by its own process, so the stations
+# use separate cores, and their gesture updates are published to the gallery frontends connected to the pool.
+# Without an authentication key, given or in the environment variable, a random key is generated, which the
+# frontends have to be given. The updates are sent as JSON rather than pickled.
+class StationPool:
+    def __init__(self, sources, address=DEFAULT_ADDRESS, authkey=None, detector_options=None):
+        # The stations are named by their position in the list of sources.
+        self.sources = list(sources)
+        self.address = address
+        self.authkey = resolve_authkey(authkey) or secrets.token_hex(16).encode('ascii')
+        self.detector_options = dict(detector_options or {})
+        # We use spawned processes, which do not inherit the state of mediapipe or of the webcam.
+        self._context = multiprocessing.get_context('spawn')
+        self.updates = self._context.Queue()
+        self._stop_event = self._context.Event()
+        self._processes = []
+        self._clients = []
+        self._clients_lock = threading.Lock()
+        self._listener = None
+        self._running = False
+
+    # Function to start the station processes and the publisher.
+    def start(self):
+        self._running = True
+        for station, source in enumerate(self.sources):
+            process = self._context.Process(
+                target=run_station, name=f"gesture-station-{station}",
+                args=(station, source, self.updates, self._stop_event, self.detector_options), daemon=True)
+            process.start()
+            self._processes.append(process)
+
+        if self.address is not None:
+            # The listener does not authenticate the connections itself, as it would do it in accept(), where a
+            # client that never answers would block the others; each connection is authenticated on its own thread.
+            self._listener = Listener(self.address)
+            threading.Thread(target=self._accept_loop, name="station-accept", daemon=True).start()
+            threading.Thread(target=self._publish_loop, name="station-publish", daemon=True).start()
+
+    # Function to check whether any station is still running.
+    def is_alive(self):
+        return any(process.is_alive() for process in self._processes)
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                connection = self._listener.accept()
+            except (OSError, EOFError):
+                if not self._running:
+                    return
+                continue
+            threading.Thread(target=self._authenticate, args=(connection,), name="station-authenticate",
+                             daemon=True).start()
+
+    # Function to authenticate a connection with the handshake of Listener.accept(), and publish to it once done.
+    def _authenticate(self, connection):
+        try:
+            deliver_challenge(connection, self.authkey)
+            answer_challenge(connection, self.authkey)
+        except multiprocessing.AuthenticationError:
+            # A client with a different key is refused, and the pool keeps accepting the others.
+            print("Warning: Refused a connection to the station pool with a wrong authentication key.")
+            connection.close()
+            return
+        except (OSError, EOFError):
+            connection.close()
+            return
+        with self._clients_lock:
+            if not self._running:
+                connection.close()
+                return
+            self._clients.append(connection)
+
+    def _publish_loop(self):
+        while self._running:
+            try:
+                update = self.updates.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            with self._clients_lock:
+                for connection in list(self._clients):
+                    try:
+                        connection.send_bytes(json.dumps(update).encode('utf-8'))
+                    except (OSError, EOFError):
+                        # The frontend disconnected.
+                        self._clients.remove(connection)
+                        connection.close()
+
+    # Function to stop the station processes and the publisher.
+    def stop(self, timeout: float = 5.0):
+        self._running = False
+        self._stop_event.set()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        if self._listener is not None:
+            self._listener.close()
+        with self._clients_lock:
+            for connection in self._clients:
+                connection.close()
+            self._clients.clear()
+
+
+# We define the client used by a gallery frontend to receive the gestures of one station of a pool.
+# It has the same start(), poll() and stop() methods as GesturePipeline, so ArtApp can use either.
+# It needs the authentication key of the pool, given or in the environment variable.
+class StationClient:
+    def __init__(self, station: int, address=DEFAULT_ADDRESS, authkey=None):
+        self.station = station
+        self.address = address
+        self.authkey = resolve_authkey(authkey)
+        if self.authkey is None:
+            raise ValueError(f"The authentication key of the station pool is needed: set {AUTHKEY_ENV}.")
+        self._gestures = queue.Queue()
+        self._connection = None
+        self._thread = None
+        self._running = False
+
+    # Function to connect to the pool and receive its updates in the background.
+    def start(self):
+        self._connection = Client(self.address, authkey=self.authkey)
+        self._running = True
+        self._thread = threading.Thread(target=self._receive_loop, name="station-client", daemon=True)
+        self._thread.start()
+
+    def _receive_loop(self):
+        try:
+            while self._running:
+                # We wait for updates with a timeout, so that the loop notices when it is stopped.
+                if not self._connection.poll(0.2):
+                    continue
+                update = GestureUpdate(*json.loads(self._connection.recv_bytes()))
+                if update.station == self.station:
+                    self._gestures.put(update.gesture)
+        except (OSError, EOFError, ValueError, TypeError):
+            print(f"Error: Lost the connection to the station pool at {self.address}.")
+        finally:
+            self._connection.close()
+
+    # Function to collect every gesture received since the last call without blocking.
+    def poll(self):
+        gestures = []
+        while True:
+            try:
+                gestures.append(self._gestures.get_nowait())
+            except queue.Empty:
+                return gestures
+
+    # Function to disconnect from the pool. Like GesturePipeline.stop, it returns whether the thread finished.
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+        return True
+
+
+# Function to parse an address given as host:port.
+def parse_address(text):
+    host, port = text.rsplit(':', 1)
+    return host, int(port)
+
+
+# If the file is run directly, we start one station per source and publish their gestures until interrupted.
+if __name__ == "__main__":
+    from gesture_backends import add_backend_arguments, backend_options
+    parser = argparse.ArgumentParser(description="Run one gesture recognition process per camera or video file.")
+    parser.add_argument('sources', nargs='+', help="Webcam device indices or video file paths.")
+    parser.add_argument('--address', type=parse_address, default=DEFAULT_ADDRESS,
+                        help="Address on which the gestures are published, as host:port.")
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+
+    pool = StationPool(args.sources, args.address, detector_options=backend_options(args))
+    pool.start()
+    print(f"Publishing the gestures of {len(args.sources)} stations on {args.address[0]}:{args.address[1]}.")
+    if resolve_authkey() is None:
+        # The generated key is only shown once; the frontends are started with it in the environment variable.
+        print(f"Authentication key: {pool.authkey.decode('ascii')} (set {AUTHKEY_ENV} to it for the frontends)")
+    try:
+        while pool.is_alive():
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.stop()
@@ -0,0 +1,23 @@
+# We test that the gesture event machine fires a held gesture once.
+from gesture_events import ONSET, GestureEventMachine
+
+
+# Function to replay (gesture, timestamp) pairs and return the gestures of the onset events.
+def onsets(machine, frames):
+    return [event.gesture for gesture, timestamp in frames
+            for event in machine.update(gesture, timestamp) if event.kind == ONSET]
+
+
+# A held gesture that drops out of detection and comes back within its cooldown does not fire again
+# once the cooldown is over.
+def test_gesture_back_within_cooldown_does_not_fire_twice():
+    machine = GestureEventMachine(default_cooldown=0.5)
+    frames = [("Next", 0.0), ("Next", 0.1), ("None", 0.2), ("Next", 0.3), ("Next", 0.6)]
+    assert onsets(machine, frames) == ["Next"]
+
+
+# The gesture fires again once the hand left the frame after the cooldown.
+def test_gesture_fires_again_after_the_hand_left_after_the_cooldown():
+    machine = GestureEventMachine(default_cooldown=0.5)
+    frames = [("Next", 0.0), ("None", 0.2), ("Next", 0.3), ("None", 0.7), ("Next", 0.8)]
+    assert onsets(machine, frames) == ["Next", "Next"]
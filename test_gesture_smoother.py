@@ -0,0 +1,31 @@
+# We test the confidence-weighted vote of the gesture smoother.
+from gesture_detector import GestureSmoother
+
+
+# Three frames of a gesture recognized with a low probability outweigh two frames without hand.
+def test_low_confidence_gesture_beats_fewer_frames_without_hand():
+    smoother = GestureSmoother(window=5)
+    for gesture, confidence in [("None", None), ("Next", 0.6), ("None", None), ("Next", 0.6), ("Next", 0.6)]:
+        smoothed = smoother.update(gesture, confidence)
+    assert smoothed == "Next"
+
+
+# Frames without hand weigh as much as the average hand of the window, so they win when they are the majority.
+def test_frames_without_hand_win_when_they_are_the_majority():
+    smoother = GestureSmoother(window=5)
+    for gesture, confidence in [("Next", 0.6), ("Next", 0.6), ("None", None), ("None", None), ("None", None)]:
+        smoothed = smoother.update(gesture, confidence)
+    assert smoothed == "None"
+
+
+# The weight of a frame without hand follows the hands in the window, and the last hand once they left it.
+def test_weight_without_confidence_follows_the_hands_of_the_window():
+    smoother = GestureSmoother(window=3)
+    smoother.update("Like", 0.4)
+    smoother.update("Like", 0.8)
+    smoother.update("None")
+    assert abs(smoother._weights[2] - 0.6) < 1e-9
+    smoother.update("None")
+    smoother.update("None")
+    smoother.update("None")
+    assert abs(smoother._weights[0] - 0.8) < 1e-9
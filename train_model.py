@@ -1,40 +1,244 @@
 # We import the necessary modules for data manipulation and machine learning model creation.
+import argparse
+import itertools
+import multiprocessing
+import os
 import pickle
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import StratifiedKFold, cross_val_score
+from sklearn.neighbors import KNeighborsClassifier
 from sklearn.svm import SVC
 from sklearn.preprocessing import StandardScaler
 from sklearn.pipeline import make_pipeline
+from gesture_dataset import DATASET_DIR, compact, load_dataset
+from gesture_features import FEATURE_SETS, landmark_features
+from linear_gesture_model import LINEAR_MODEL_PATH, LinearGestureModel, file_digest, verify_parity
 
-# We open the 'gesture_data.pkl' file in binary read mode and load the gesture data.
-with open('gesture_data.pkl', 'rb') as f:
-    gesture_data = pickle.load(f)
+# The file in which the selected model is saved.
+MODEL_PATH = 'gesture_model.pkl'
 
-# We initialize the lists for the features (X) and labels (y) of the gestures.
-X = []
-y = []
+# The model families and the values of their hyperparameters that are searched.
+SEARCH_SPACE = {
+    'linear_svc': {'C': [0.1, 1.0, 10.0]},
+    'rbf_svc': {'C': [1.0, 10.0], 'gamma': ['scale', 0.1]},
+    'logistic_regression': {'C': [0.1, 1.0, 10.0]},
+    'knn': {'n_neighbors': [3, 7]},
+    'random_forest': {'n_estimators': [50, 150], 'max_depth': [None, 12]},
+}
 
-# We walk through each gesture and its set of landmarks.
-for gesture, landmarks in gesture_data.items():
-    # For each set of landmark points, we flatten the array into a vector and add it to X.
-    for landmark in landmarks:
-        X.append(np.array(landmark).flatten())
-        # We add the label corresponding to the gesture in y.
-        y.append(gesture)
+# The preprocessing options that are searched for every model, with every feature set of gesture_features.py.
+SCALERS = ['standard', 'none']
 
-# We convert the x and y lists to NumPy arrays to facilitate further processing.
-X = np.array(X)
-y = np.array(y)
 
-# We create a pipeline that includes standard data scaling and linear kernel SVM model.
-model = make_pipeline(StandardScaler(), SVC(kernel='linear', probability=True))
+# Function to build a model of a family with the given hyperparameters and preprocessing.
+# probability is only used by the SVMs, whose probabilities are calibrated with an extra internal cross-validation.
+def build_model(family, params, scaler, probability: bool = False):
+    if family == 'linear_svc':
+        classifier = SVC(kernel='linear', probability=probability, **params)
+    elif family == 'rbf_svc':
+        classifier = SVC(kernel='rbf', probability=probability, **params)
+    elif family == 'logistic_regression':
+        classifier = LogisticRegression(max_iter=2000, **params)
+    elif family == 'knn':
+        classifier = KNeighborsClassifier(**params)
+    elif family == 'random_forest':
+        classifier = RandomForestClassifier(random_state=0, **params)
+    else:
+        raise ValueError(f"Unknown model family: {family}")
+    return make_pipeline(StandardScaler(), classifier) if scaler == 'standard' else make_pipeline(classifier)
 
-# We train the model on the training data (X and y).
-model.fit(X, y)
 
-# We save the trained model in a binary file 'gesture_model.pkl'.
-with open('gesture_model.pkl', 'wb') as f:
-    pickle.dump(model, f)
+# Function to list the candidates of the search as (family, params, scaler, feature_set) tuples. With n_iter,
+# a random subset of that size is searched instead of the whole grid.
+def search_candidates(families=None, n_iter=None, seed: int = 0, feature_sets=FEATURE_SETS):
+    candidates = []
+    for family in families or SEARCH_SPACE:
+        names = list(SEARCH_SPACE[family])
+        for values in itertools.product(*(SEARCH_SPACE[family][name] for name in names)):
+            for scaler, feature_set in itertools.product(SCALERS, feature_sets):
+                candidates.append((family, dict(zip(names, values)), scaler, feature_set))
+    if n_iter is not None and n_iter < len(candidates):
+        candidates = random.Random(seed).sample(candidates, n_iter)
+    return candidates
 
 
-# We display a confirmation message that the model training is complete.
-print("Model training complete.")
+# The training data of a worker process, loaded once per process by load_training_data(), and its features.
+_landmarks = _y = None
+_features = {}
+
+
+# Function run once in each worker process to load the dataset, which is memory-mapped rather than sent to it.
+def load_training_data(dataset_path):
+    global _landmarks, _y
+    _landmarks, _y = load_dataset(dataset_path).features_and_labels()
+
+
+# Function to get the features of the training data, computed once per feature set in each worker process.
+def training_features(feature_set):
+    if feature_set not in _features:
+        _features[feature_set] = landmark_features(_landmarks, feature_set)
+    return _features[feature_set]
+
+
+# Function run in a worker process to cross-validate a candidate and fit it on all the data.
+# The probabilities are not calibrated during the cross-validation, which would cost five extra fits per fold,
+# since they do not change the predictions. The model fitted on all the data has them, like the deployed model,
+# so that its latency is measured on the predict_proba call the gallery makes.
+def evaluate_candidate(candidate, n_folds: int = 5):
+    family, params, scaler, feature_set = candidate
+    X = training_features(feature_set)
+    folds = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=0)
+    start = time.perf_counter()
+    scores = cross_val_score(build_model(family, params, scaler), X, _y, cv=folds)
+    model = build_model(family, params, scaler, probability=True).fit(X, _y)
+    model.feature_set_ = feature_set
+    return {'family': family, 'params': params, 'scaler': scaler, 'feature_set': feature_set,
+            'accuracy': scores.mean(), 'accuracy_std': scores.std(), 'train_seconds': time.perf_counter() - start,
+            'model': model}
+
+
+# Function to get the model the gallery runs for a fitted model: linear SVMs are exported to NumPy.
+def deployed_model(model):
+    try:
+        return LinearGestureModel.from_sklearn(model)
+    except ValueError:
+        return model
+
+
+# Function to classify hands the way GestureDetectorLogger.classify_hands does in the gallery: with the
+# probabilities, which weigh the votes of the smoothing, when the model provides them.
+def classify_like_gallery(model, features):
+    if hasattr(model, 'predict_proba'):
+        probabilities = model.predict_proba(features)
+        best = probabilities.argmax(axis=1)
+        return model.classes_[best], probabilities[np.arange(len(best)), best]
+    return model.predict(features), np.ones(len(features))
+
+
+# Function to measure the median time to classify the landmarks of a single hand, as done for every frame,
+# including the computation of the features, in microseconds.
+def prediction_latency(model, landmarks, feature_set, repeat: int = 200):
+    samples = landmarks[np.random.default_rng(0).integers(0, len(landmarks), repeat)]
+    durations = []
+    for i in range(repeat):
+        sample = samples[i:i + 1]
+        start = time.perf_counter()
+        classify_like_gallery(model, landmark_features(sample, feature_set))
+        durations.append(time.perf_counter() - start)
+    return float(np.median(durations)) * 1e6
+
+
+# Function to run the search in parallel worker processes and return the results, with the latency of each model.
+def run_search(candidates, dataset_path=DATASET_DIR, workers=None):
+    results = []
+    # The dataset is compacted into a single chunk first, which every worker memory-maps; with the many chunks
+    # written by collect_data.py, each worker would otherwise concatenate them into its own copy.
+    chunk_count = len(load_dataset(dataset_path).chunks)
+    if chunk_count > 1:
+        print(f"Compacting the {chunk_count} chunks of {dataset_path} into one.")
+        compact(dataset_path)
+    # We use spawned processes, which load the dataset themselves.
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=load_training_data,
+                             initargs=(dataset_path,)) as executor:
+        futures = [executor.submit(evaluate_candidate, candidate) for candidate in candidates]
+        for future in as_completed(futures):
+            results.append(future.result())
+
+    # The latencies are measured here, one model at a time, so that they are not skewed by the other workers.
+    landmarks, _ = load_dataset(dataset_path).features_and_labels()
+    for result in results:
+        result['latency_us'] = prediction_latency(deployed_model(result['model']), landmarks,
+                                                  result['feature_set'])
+    return results
+
+
+# Function to select the most accurate model whose latency is within the budget. Among models whose accuracy
+# is within tolerance of the best, the fastest is selected. If no model is fast enough, the fastest is selected.
+def select_model(results, latency_budget_us: float, tolerance: float = 0.002):
+    affordable = [result for result in results if result['latency_us'] <= latency_budget_us]
+    if not affordable:
+        print(f"Warning: No model predicts within {latency_budget_us:.0f} us; the fastest one is selected.")
+        return min(results, key=lambda result: result['latency_us'])
+    best_accuracy = max(result['accuracy'] for result in affordable)
+    return min((result for result in affordable if result['accuracy'] >= best_accuracy - tolerance),
+               key=lambda result: result['latency_us'])
+
+
+# Function to print the results of the search, from the most to the least accurate model.
+def print_results(results, selected=None):
+    print(f"{'model':<22} {'scaler':<9} {'features':<11} {'hyperparameters':<32} {'accuracy':>15} {'latency':>10}"
+          f" {'train':>8}")
+    for result in sorted(results, key=lambda result: (-result['accuracy'], result['latency_us'])):
+        params = ', '.join(f"{name}={value}" for name, value in result['params'].items())
+        marker = ' *' if result is selected else ''
+        print(f"{result['family']:<22} {result['scaler']:<9} {result['feature_set']:<11} {params:<32} "
+              f"{result['accuracy']:>8.2%} ±{result['accuracy_std']:>5.2%} {result['latency_us']:>7.1f} us "
+              f"{result['train_seconds']:>6.1f} s{marker}")
+
+
+# Function to save the selected model, fitted on all the data with calibrated probabilities. The model fitted by
+# evaluate_candidate() is reused, and only a selection without one is fitted here. The NumPy export is updated
+# if the model can be exported and matches the sklearn model on the training data, as checked by export_model,
+# and removed otherwise so that the gallery does not load it.
+def train_final_model(selected, dataset_path=DATASET_DIR, model_path=MODEL_PATH, linear_model_path=LINEAR_MODEL_PATH):
+    landmarks, y = load_dataset(dataset_path).features_and_labels()
+    X = landmark_features(landmarks, selected['feature_set'])
+    model = selected.get('model')
+    if model is None:
+        model = build_model(selected['family'], selected['params'], selected['scaler'], probability=True).fit(X, y)
+        # The feature set is stored with the model, so that the gallery computes the same features.
+        model.feature_set_ = selected['feature_set']
+
+    # We save the trained model in a binary file 'gesture_model.pkl'.
+    with open(model_path, 'wb') as f:
+        pickle.dump(model, f)
+
+    # We also export the model for inference with NumPy only, which is what the gallery loads.
+    try:
+        linear_model = LinearGestureModel.from_sklearn(model, file_digest(model_path))
+        verify_parity(model, linear_model, X)
+        linear_model.save(linear_model_path)
+        print(f"Model exported to {linear_model_path}.")
+        return model
+    except ValueError:
+        pass  # The model is not a linear SVM.
+    except RuntimeError as e:
+        print(e)
+    if os.path.exists(linear_model_path):
+        os.remove(linear_model_path)
+        print(f"Removed {linear_model_path}, which was exported from a previous model.")
+    return model
+
+
+# If the file is run directly, we search for the best model under the latency budget and train it.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search for the best gesture model and train it.")
+    parser.add_argument('--dataset', default=DATASET_DIR, help="Directory of the dataset.")
+    parser.add_argument('--families', nargs='+', choices=list(SEARCH_SPACE), help="Model families to search.")
+    parser.add_argument('--feature-sets', nargs='+', choices=FEATURE_SETS, default=list(FEATURE_SETS),
+                        help="Feature sets to search.")
+    parser.add_argument('--n-iter', type=int, help="Number of random candidates to search instead of the whole grid.")
+    parser.add_argument('--latency-budget', type=float, default=200.0,
+                        help="Maximum time to classify a hand, in microseconds.")
+    parser.add_argument('--workers', type=int, default=None, help="Number of candidates evaluated in parallel.")
+    args = parser.parse_args()
+
+    # We load the collected dataset first, converting 'gesture_data.pkl' if needed.
+    print(f"Training on {len(load_dataset(args.dataset))} samples.")
+    candidates = search_candidates(args.families, args.n_iter, feature_sets=args.feature_sets)
+    print(f"Evaluating {len(candidates)} candidates with 5-fold cross-validation.")
+    results = run_search(candidates, args.dataset, args.workers)
+    selected = select_model(results, args.latency_budget)
+    print_results(results, selected)
+
+    # We train the selected model on all the data.
+    train_final_model(selected, args.dataset)
+
+    # We display a confirmation message that the model training is complete.
+    print("Model training complete.")